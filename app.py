@@ -1,33 +1,42 @@
-from flask import Flask, render_template, request, session, redirect, url_for, jsonify
-from flask_session import Session
+from flask import Flask, render_template, request, session, redirect, url_for, jsonify, g, send_from_directory, abort, make_response
 from werkzeug.security import generate_password_hash
 from werkzeug.security import check_password_hash
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.utils import secure_filename
+from markupsafe import Markup
 import gspread
 import requests
 import json
 import time
 import uuid
 import os
+
+from dotenv import load_dotenv
+# Before importing x: its settings (session backend, pool size, caches) are read from the environment at import
+load_dotenv()
+
 import x 
 import dictionary
 import re
 import io
+import random
 import csv
 from datetime import datetime, timedelta
 
 from oauth2client.service_account import ServiceAccountCredentials
 from icecream import ic
 ic.configureOutput(prefix=f'----- | ', includeContext=True)
-from dotenv import load_dotenv
-
-load_dotenv()
 
 app = Flask(__name__)
-app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-key-change-me")
+app.secret_key = os.environ.get("SECRET_KEY", x.DEV_SECRET_KEY)
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024
 
-app.config['SESSION_TYPE'] = 'filesystem'
-Session(app)
+x.configure_sessions(app)
+
+app.teardown_appcontext(x.db_teardown)
+app.before_request(x.begin_request_stats)
+app.before_request(x.catalog.maybe_reload)
+app.after_request(x.finish_request_stats)
 
 ##############################
 @app.context_processor
@@ -62,12 +71,15 @@ def global_variables():
             # For other endpoints, fallback to home with language
             return url_for('home', lan=language)
     
+    current_language = getattr(x, 'default_language', 'english')
     return dict(
         dictionary = dictionary,
         x = x,
+        lans = x.catalog.lookup(current_language),
         is_admin = is_admin(),
         get_language_url = get_language_url,
-        current_language = getattr(x, 'default_language', 'english')
+        current_language = current_language,
+        post_card = render_post_card
     )
 
 ##############################
@@ -82,22 +94,39 @@ def get_user_id():
     user = get_user()
     return user.get("id") if user else None
 
-def is_admin():
-    """Check if current user is an admin."""
+def get_current_user_row():
+    """The logged-in user's row (role, blocked flag, name, avatar), queried at most once per request.
+
+    Cached on g only: role and is_blocked decide admin and write access, and a process-wide cache
+    would keep a blocked or demoted user's old row in the other workers until it expired.
+    """
     user_id = get_user_id()
-    if not user_id:
-        return False
+    if not user_id: return None
+    if "current_user_row" in g: return g.current_user_row
+    
     try:
         db, cursor = x.db()
-        q = "SELECT role FROM users WHERE id = %s"
+        q = "SELECT id, name, avatar, role, is_blocked FROM users WHERE id = %s"
         cursor.execute(q, (user_id,))
-        user = cursor.fetchone()
-        return user and user.get("role") == "admin"
+        user_row = cursor.fetchone()
+    finally:
+        cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
+    g.current_user_row = user_row
+    return user_row
+
+def invalidate_user_row(user_id):
+    """Forget the request's users row after it changes."""
+    current = g.get("current_user_row")
+    if current and current["id"] == user_id: g.pop("current_user_row")
+
+def is_admin():
+    """Check if current user is an admin."""
+    try:
+        user = get_current_user_row()
+        return bool(user and user.get("role") == "admin")
     except Exception as ex:
         ic(ex)
         return False
-    finally:
-        cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
 
 def require_admin():
     """Decorator to require admin access."""
@@ -114,9 +143,566 @@ def is_ajax():
 def json_response(data, status=200):
     return jsonify(data), status
 
+def load_comments(cursor, posts, limit=None):
+    """Attach the newest comments (oldest first) and the comment total to each post in one query."""
+    if limit is None: limit = x.COMMENT_PREVIEW_LIMIT
+    by_id = {}
+    for post in posts:
+        post["comments"] = []
+        post["comment_count"] = 0
+        by_id[post["id"]] = post
+    if not by_id: return posts
+    
+    placeholders = ", ".join(["%s"] * len(by_id))
+    q = f"""
+        SELECT id, post_id, content, created_at, user_name, user_avatar, comment_total
+        FROM (
+            SELECT c.id, c.post_id, c.content, c.created_at, u.name as user_name, u.avatar as user_avatar,
+                   ROW_NUMBER() OVER (PARTITION BY c.post_id ORDER BY c.created_at DESC, c.id DESC) as rn,
+                   COUNT(*) OVER (PARTITION BY c.post_id) as comment_total
+            FROM comments c
+            JOIN users u ON c.user_id = u.id
+            WHERE c.post_id IN ({placeholders})
+        ) ranked
+        WHERE rn <= %s
+        ORDER BY post_id, created_at ASC, id ASC
+    """
+    cursor.execute(q, (*by_id.keys(), limit))
+    for comment in cursor.fetchall():
+        post = by_id[comment.pop("post_id")]
+        post["comment_count"] = comment.pop("comment_total")
+        post["comments"].append(comment)
+    return posts
+
+##############################
+def get_block_sets(cursor, user_id):
+    """(ids user_id blocked, ids that blocked user_id), cached per process until a block changes."""
+    cache = g.setdefault("block_sets", {})
+    if user_id in cache: return cache[user_id]
+    
+    block_sets = x.block_cache.get(user_id)
+    if block_sets is None:
+        q = """
+            SELECT blocked_id as user_id, 'blocked' as direction FROM user_blocks WHERE blocker_id = %s
+            UNION ALL
+            SELECT blocker_id as user_id, 'blocked_by' as direction FROM user_blocks WHERE blocked_id = %s
+        """
+        cursor.execute(q, (user_id, user_id))
+        rows = cursor.fetchall()
+        block_sets = (
+            frozenset(row["user_id"] for row in rows if row["direction"] == "blocked"),
+            frozenset(row["user_id"] for row in rows if row["direction"] == "blocked_by"),
+        )
+        x.block_cache.set(user_id, block_sets)
+    cache[user_id] = block_sets
+    return block_sets
+
+def get_hidden_user_ids(cursor, user_id):
+    """Everyone user_id blocked or was blocked by; their content is hidden both ways."""
+    blocked, blocked_by = get_block_sets(cursor, user_id)
+    return blocked | blocked_by
+
+def is_blocked_between(cursor, user_id, other_id):
+    """Whether either user blocked the other, read from user_blocks; for writes, where the cached sets may be stale."""
+    q = """
+        SELECT 1 FROM user_blocks
+        WHERE (blocker_id = %s AND blocked_id = %s) OR (blocker_id = %s AND blocked_id = %s)
+        LIMIT 1
+    """
+    cursor.execute(q, (user_id, other_id, other_id, user_id))
+    return cursor.fetchone() is not None
+
+def hidden_users_clause(cursor, user_id, column="u.id"):
+    hidden = sorted(get_hidden_user_ids(cursor, user_id))
+    if not hidden: return "", ()
+    return f"AND {column} NOT IN ({', '.join(['%s'] * len(hidden))})", tuple(hidden)
+
+def invalidate_block_sets(*user_ids):
+    for user_id in user_ids:
+        x.block_cache.delete(user_id)
+        g.get("block_sets", {}).pop(user_id, None)
+
+##############################
+def get_tag_stats(cursor):
+    """Top tags overall and for the last 7 days, read from the tag_stats rollup and kept in memory."""
+    tag_stats = x.tag_stats_cache.get("tag_stats")
+    if tag_stats is None:
+        q = """
+            SELECT name, post_count, recent_post_count
+            FROM tag_stats
+            ORDER BY post_count DESC
+            LIMIT %s
+        """
+        cursor.execute(q, (x.TAG_STATS_TOP_K,))
+        popular = cursor.fetchall()
+        
+        q = """
+            SELECT name, recent_post_count as post_count
+            FROM tag_stats
+            WHERE recent_post_count > 0
+            ORDER BY recent_post_count DESC
+            LIMIT %s
+        """
+        cursor.execute(q, (x.TAG_STATS_TOP_K,))
+        recent = cursor.fetchall()
+        
+        tag_stats = {"popular": popular, "recent": recent}
+        x.tag_stats_cache.set("tag_stats", tag_stats)
+    return tag_stats
+
+def get_trending_tags(cursor, limit=5):
+    """Most used tags of the week (all time if fewer than 3), ties shuffled."""
+    tag_stats = get_tag_stats(cursor)
+    candidates = tag_stats["recent"] if len(tag_stats["recent"]) >= 3 else tag_stats["popular"]
+    return sorted(candidates, key=lambda tag: (-tag["post_count"], random.random()))[:limit]
+
+##############################
+def keyset_clause(before, created_col="p.created_at", id_col="p.id"):
+    """SQL and params for 'older than (created_at, id)'; empty on the first page."""
+    if not before: return "", ()
+    created_at, post_id = before
+    return f"AND ({created_col} < %s OR ({created_col} = %s AND {id_col} < %s))", (created_at, created_at, post_id)
+
+def fetch_post_page(cursor, viewer_id, page_q, page_params, limit):
+    """Hydrate one page of post ids (selected by page_q) into feed rows with tags and comments.
+
+    page_q must select p.id ordered by (p.created_at, p.id) DESC and end with LIMIT %s;
+    one extra row is fetched to tell whether another page exists.
+    """
+    q = f"""
+        SELECT p.id, p.content, p.media_path, p.media_type, p.media_duration, p.media_peaks, p.created_at,
+               p.total_likes + {x.pending_counter_sql("post_likes", "p.id")} as total_likes,
+               u.id as user_id, u.name as user_name, u.avatar as user_avatar, p.user_id as post_owner_id,
+               (SELECT COUNT(*) FROM likes WHERE post_id = p.id AND user_id = %s) as user_liked,
+               GROUP_CONCAT(DISTINCT t.name ORDER BY t.name SEPARATOR ', ') as tags
+        FROM ({page_q}) page
+        JOIN posts p ON p.id = page.id
+        JOIN users u ON p.user_id = u.id
+        LEFT JOIN post_tags pt ON p.id = pt.post_id
+        LEFT JOIN tags t ON pt.tag_id = t.id
+        GROUP BY p.id
+        ORDER BY p.created_at DESC, p.id DESC
+    """
+    cursor.execute(q, (viewer_id, *page_params, limit + 1))
+    posts = cursor.fetchall()
+    
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = x.encode_feed_cursor(posts[-1])
+    for post in posts:
+        post["media_peaks"] = json.loads(post["media_peaks"]) if post.get("media_peaks") else None
+    load_comments(cursor, posts)
+    return posts, next_cursor
+
+def home_page_query(cursor, user_id, before=None):
+    """Page query (see fetch_post_page) for every visible post, newest first."""
+    keyset, keyset_params = keyset_clause(before)
+    hidden, hidden_params = hidden_users_clause(cursor, user_id)
+    q = f"""
+        SELECT p.id
+        FROM posts p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.is_blocked = FALSE 
+        AND u.is_blocked = FALSE
+        {hidden}
+        {keyset}
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT %s
+    """
+    return q, (*hidden_params, *keyset_params)
+
+def tag_page_query(cursor, user_id, tag_name, before=None):
+    keyset, keyset_params = keyset_clause(before)
+    hidden, hidden_params = hidden_users_clause(cursor, user_id)
+    q = f"""
+        SELECT p.id
+        FROM posts p
+        JOIN users u ON p.user_id = u.id
+        JOIN post_tags pt ON p.id = pt.post_id
+        JOIN tags t ON pt.tag_id = t.id
+        WHERE t.name = %s
+        AND p.is_blocked = FALSE 
+        AND u.is_blocked = FALSE
+        {hidden}
+        {keyset}
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT %s
+    """
+    return q, (tag_name, *hidden_params, *keyset_params)
+
+def profile_page_query(profile_user_id, before=None):
+    keyset, keyset_params = keyset_clause(before)
+    q = f"""
+        SELECT p.id
+        FROM posts p
+        WHERE p.user_id = %s AND p.is_blocked = FALSE
+        {keyset}
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT %s
+    """
+    return q, (profile_user_id, *keyset_params)
+
+def timeline_page_query(cursor, user_id, before=None, limit=None):
+    """Home feed from the user's materialized timeline, merged with posts pulled from followed high-fan-out authors."""
+    limit = limit or x.FEED_PAGE_SIZE
+    
+    q = "SELECT 1 FROM follows WHERE follower_id = %s LIMIT 1"
+    cursor.execute(q, (user_id,))
+    if not cursor.fetchone():
+        # Not following anyone yet: show everything instead of an empty feed
+        return home_page_query(cursor, user_id, before)
+    
+    timeline_keyset, timeline_params = keyset_clause(before, "tl.created_at", "tl.post_id")
+    pull_keyset, pull_params = keyset_clause(before)
+    hidden, hidden_params = hidden_users_clause(cursor, user_id)
+    # Timeline rows are filtered on read too: a block or moderation can race a fan-out that writes them back
+    q = f"""
+        SELECT id FROM (
+            (SELECT tl.post_id as id, tl.created_at
+             FROM timelines tl
+             JOIN posts p ON p.id = tl.post_id
+             JOIN users u ON u.id = tl.author_id
+             WHERE tl.user_id = %s
+             AND p.is_blocked = FALSE
+             AND u.is_blocked = FALSE
+             {hidden}
+             {timeline_keyset}
+             ORDER BY tl.created_at DESC, tl.post_id DESC
+             LIMIT %s)
+            UNION
+            (SELECT p.id, p.created_at
+             FROM follows f
+             JOIN users u ON u.id = f.following_id
+             JOIN posts p ON p.user_id = f.following_id
+             WHERE f.follower_id = %s
+             AND u.timeline_pull = TRUE
+             AND u.is_blocked = FALSE
+             AND p.is_blocked = FALSE
+             {hidden}
+             {pull_keyset}
+             ORDER BY p.created_at DESC, p.id DESC
+             LIMIT %s)
+        ) merged
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """
+    return q, (user_id, *hidden_params, *timeline_params, limit + 1, user_id, *hidden_params, *pull_params, limit + 1)
+
+def fetch_home_posts(cursor, user_id, before=None, limit=None):
+    return fetch_post_page(cursor, user_id, *home_page_query(cursor, user_id, before), limit or x.FEED_PAGE_SIZE)
+
+def fetch_tag_posts(cursor, user_id, tag_name, before=None, limit=None):
+    return fetch_post_page(cursor, user_id, *tag_page_query(cursor, user_id, tag_name, before), limit or x.FEED_PAGE_SIZE)
+
+def fetch_profile_posts(cursor, viewer_id, profile_user_id, before=None, limit=None):
+    return fetch_post_page(cursor, viewer_id, *profile_page_query(profile_user_id, before), limit or x.FEED_PAGE_SIZE)
+
+def fetch_timeline_posts(cursor, user_id, before=None, limit=None):
+    limit = limit or x.FEED_PAGE_SIZE
+    return fetch_post_page(cursor, user_id, *timeline_page_query(cursor, user_id, before, limit), limit)
+
+def resolve_page(cursor, page_q, page_params, limit=None):
+    """Run a page query once; returns an equivalent page query over the ids it selected.
+
+    Routes that build an ETag pass the result to both page_version and fetch_post_page,
+    so the page selection (timeline merge, tag join, block filters) runs once per request.
+    """
+    limit = limit or x.FEED_PAGE_SIZE
+    cursor.execute(page_q, (*page_params, limit + 1))
+    ids = tuple(row["id"] for row in cursor.fetchall())
+    q = f"""
+        SELECT p.id FROM posts p
+        WHERE p.id IN ({', '.join(['%s'] * len(ids)) or 'NULL'})
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT %s
+    """
+    return q, ids
+
+def page_version(cursor, viewer_id, page_q, page_params, limit=None):
+    """A cheap stand-in for fetch_post_page's result, for ETags: changes whenever the hydrated page would.
+
+    Reads only ids, counters and timestamps of the page's posts: their row state and flushed likes,
+    pending like deltas, the viewer's likes, tags, comments and the authors' and commenters' rows.
+    """
+    limit = limit or x.FEED_PAGE_SIZE
+    q = f"""
+        WITH page AS ({page_q})
+        SELECT
+            (SELECT GROUP_CONCAT(p.id, ':', p.total_likes, ':', p.updated_at, ':', COALESCE(p.media_status, ''), ':', u.updated_at
+                                 ORDER BY p.id)
+             FROM page JOIN posts p ON p.id = page.id JOIN users u ON u.id = p.user_id) as posts,
+            (SELECT MAX(cd.id) FROM page JOIN counter_deltas cd ON cd.target_id = page.id AND cd.counter = 'post_likes') as pending_likes,
+            (SELECT GROUP_CONCAT(l.post_id ORDER BY l.post_id) FROM page JOIN likes l ON l.post_id = page.id AND l.user_id = %s) as liked,
+            (SELECT GROUP_CONCAT(pt.post_id, ':', pt.tag_id ORDER BY pt.post_id, pt.tag_id) FROM page JOIN post_tags pt ON pt.post_id = page.id) as tags,
+            (SELECT CONCAT(COUNT(*), ':', COALESCE(MAX(c.id), 0), ':', COALESCE(MAX(cu.updated_at), ''))
+             FROM page JOIN comments c ON c.post_id = page.id JOIN users cu ON cu.id = c.user_id) as comments
+    """
+    cursor.execute(q, (*page_params, limit + 1, viewer_id))
+    return tuple(cursor.fetchone().values())
+
+
+##############################
+POST_CARD_OWNER_REGION = re.compile(r"<!--owner-->.*?<!--/owner-->", re.S)
+
+def post_card_version(post):
+    """Everything a card renders except the viewer's like state and owner controls.
+
+    Compared on every hit, so a card cached by another worker's request, or before a rename or a
+    new avatar, is re-rendered even though nothing invalidated it here.
+    """
+    comments = tuple((comment["id"], comment["user_name"], comment["user_avatar"]) for comment in post.get("comments") or ())
+    return (
+        post.get("content"), post.get("media_path"), post.get("media_type"), post.get("media_duration"),
+        tuple(post.get("media_peaks") or ()), post.get("created_at"), post.get("tags"), post.get("total_likes"),
+        post.get("user_id"), post.get("user_name"), post.get("user_avatar"), post.get("comment_count"), comments,
+    )
+
+def render_post_card(post, user_id=None, show_edit=False):
+    """A post card from the fragment cache, with the viewer's like state and owner controls patched in."""
+    language = x.default_language
+    # The catalog version retires every card rendered with the old text when translations reload
+    key = (post["id"], language, x.catalog.version)
+    version = post_card_version(post)
+    cached = x.post_card_cache.get(key)
+    if cached and cached[0] == version:
+        owner_html, public_html = cached[1], cached[2]
+    else:
+        html = app.jinja_env.get_template("_post_card_fragment.html").render(post=post, x=x, lans=x.catalog.lookup(language))
+        owner_html = html.replace("<!--owner-->", "").replace("<!--/owner-->", "")
+        public_html = POST_CARD_OWNER_REGION.sub("", html)
+        x.post_card_cache.set(key, (version, owner_html, public_html))
+
+    html = owner_html if show_edit and post.get("post_owner_id") == user_id else public_html
+    liked = bool(post.get("user_liked"))
+    html = html.replace("<!--liked-->", "liked" if liked else "", 1).replace("<!--like-icon-->", "❤️" if liked else "🤍", 1)
+    return Markup(html)
+
+def invalidate_post_card(post_id):
+    for language in x.allowed_languages:
+        x.post_card_cache.delete((post_id, language, x.catalog.version))
+
+
+##############################
+def adjust_follow_counts(cursor, follower_id, following_id, delta):
+    """Move the follower's following_count and the followed user's followers_count by delta, in one statement."""
+    q = """
+        UPDATE users
+        SET following_count = GREATEST(following_count + IF(id = %s, %s, 0), 0),
+            followers_count = GREATEST(followers_count + IF(id = %s, %s, 0), 0),
+            updated_at = updated_at
+        WHERE id IN (%s, %s)
+    """
+    cursor.execute(q, (follower_id, delta, following_id, delta, follower_id, following_id))
+
+def remove_follow(cursor, follower_id, following_id):
+    q = "DELETE FROM follows WHERE follower_id = %s AND following_id = %s"
+    cursor.execute(q, (follower_id, following_id))
+    if cursor.rowcount: adjust_follow_counts(cursor, follower_id, following_id, -1)
+    q = "DELETE FROM timelines WHERE user_id = %s AND author_id = %s"
+    cursor.execute(q, (follower_id, following_id))
+
+def toggle_follow_rows(cursor, follower_id, user_id):
+    """Follow or unfollow with counters and timelines kept in step; returns whether follower now follows."""
+    q = "SELECT id FROM follows WHERE follower_id = %s AND following_id = %s"
+    cursor.execute(q, (follower_id, user_id))
+    if cursor.fetchone():
+        remove_follow(cursor, follower_id, user_id)
+        return False
+    q = "INSERT IGNORE INTO follows (follower_id, following_id) VALUES (%s, %s)"
+    cursor.execute(q, (follower_id, user_id))
+    if cursor.rowcount:
+        adjust_follow_counts(cursor, follower_id, user_id, 1)
+        backfill_timelines(cursor, user_id, follower_id)
+    return True
+
+def adjust_post_count(cursor, user_id, delta):
+    q = "UPDATE users SET post_count = GREATEST(post_count + %s, 0), updated_at = updated_at WHERE id = %s"
+    cursor.execute(q, (delta, user_id))
+
+def fanout_post(cursor, post_id, author_id):
+    """Write a new (or unblocked) post into the author's and their followers' timelines."""
+    # Read from the database, not the user cache: an author blocked by an admin a moment ago gets no fan-out
+    q = "SELECT followers_count, timeline_pull, is_blocked FROM users WHERE id = %s"
+    cursor.execute(q, (author_id,))
+    author = cursor.fetchone()
+    if not author or author["is_blocked"]: return
+    
+    q = """
+        INSERT IGNORE INTO timelines (user_id, post_id, author_id, created_at)
+        SELECT p.user_id, p.id, p.user_id, p.created_at FROM posts p WHERE p.id = %s AND p.is_blocked = FALSE
+    """
+    cursor.execute(q, (post_id,))
+    
+    if author["followers_count"] > x.TIMELINE_FANOUT_LIMIT:
+        # Sticky: once an author is pulled, posts written while pulled never reach timelines
+        q = "UPDATE users SET timeline_pull = TRUE WHERE id = %s AND timeline_pull = FALSE"
+        cursor.execute(q, (author_id,))
+        return
+    if author["timeline_pull"]: return
+    
+    q = """
+        INSERT IGNORE INTO timelines (user_id, post_id, author_id, created_at)
+        SELECT f.follower_id, p.id, p.user_id, p.created_at
+        FROM posts p
+        JOIN follows f ON f.following_id = p.user_id
+        WHERE p.id = %s AND p.is_blocked = FALSE
+    """
+    cursor.execute(q, (post_id,))
+
+def backfill_timelines(cursor, author_id, follower_id=None):
+    """Copy an author's recent posts into one follower's timeline, or into every follower's and their own."""
+    q = "SELECT timeline_pull, is_blocked FROM users WHERE id = %s"
+    cursor.execute(q, (author_id,))
+    author = cursor.fetchone()
+    if not author or author["timeline_pull"] or author["is_blocked"]: return
+    
+    follower_filter = "AND f.follower_id = %s" if follower_id else ""
+    q = f"""
+        INSERT IGNORE INTO timelines (user_id, post_id, author_id, created_at)
+        SELECT f.follower_id, recent.id, recent.user_id, recent.created_at
+        FROM (
+            SELECT id, user_id, created_at FROM posts
+            WHERE user_id = %s AND is_blocked = FALSE
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        ) recent
+        JOIN follows f ON f.following_id = recent.user_id
+        WHERE 1 = 1 {follower_filter}
+    """
+    cursor.execute(q, (author_id, x.TIMELINE_BACKFILL_LIMIT, *((follower_id,) if follower_id else ())))
+    
+    if not follower_id:
+        q = """
+            INSERT IGNORE INTO timelines (user_id, post_id, author_id, created_at)
+            SELECT user_id, id, user_id, created_at FROM posts
+            WHERE user_id = %s AND is_blocked = FALSE
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        """
+        cursor.execute(q, (author_id, x.TIMELINE_BACKFILL_LIMIT))
+
+def index_post_search(cursor, post_id):
+    """Refresh a post's row in the full-text index (content plus tag names)."""
+    q = """
+        REPLACE INTO post_search (post_id, body)
+        SELECT p.id, CONCAT_WS(' ', p.content, GROUP_CONCAT(t.name SEPARATOR ' '))
+        FROM posts p
+        LEFT JOIN post_tags pt ON p.id = pt.post_id
+        LEFT JOIN tags t ON pt.tag_id = t.id
+        WHERE p.id = %s
+        GROUP BY p.id
+    """
+    cursor.execute(q, (post_id,))
+
+def search_users(cursor, user_id, match, prefix_pattern, limit, offset):
+    if match:
+        where, params = "MATCH(u.name, u.email) AGAINST (%s IN BOOLEAN MODE)", (match,)
+    else:
+        # Terms too short for the full-text index: fall back to an index-friendly prefix match
+        where, params = "u.name LIKE %s", (prefix_pattern,)
+    hidden, hidden_params = hidden_users_clause(cursor, user_id)
+    q = f"""
+        SELECT u.id, u.name, u.email, u.avatar
+        FROM users u
+        WHERE {where}
+        AND u.is_blocked = FALSE
+        {hidden}
+        ORDER BY {"MATCH(u.name, u.email) AGAINST (%s IN BOOLEAN MODE) DESC," if match else ""} u.id
+        LIMIT %s OFFSET %s
+    """
+    cursor.execute(q, (*params, *hidden_params, *((match,) if match else ()), limit, offset))
+    return cursor.fetchall()
+
+def search_posts(cursor, user_id, match, prefix_pattern, limit, offset):
+    if not match: return []
+    hidden, hidden_params = hidden_users_clause(cursor, user_id)
+    q = f"""
+        SELECT p.id, p.content, p.media_path, p.media_type, p.created_at,
+               p.total_likes + {x.pending_counter_sql("post_likes", "p.id")} as total_likes,
+               u.name as user_name, u.avatar as user_avatar, u.id as user_id
+        FROM (
+            SELECT post_id, MATCH(body) AGAINST (%s IN BOOLEAN MODE) as score
+            FROM post_search
+            WHERE MATCH(body) AGAINST (%s IN BOOLEAN MODE)
+        ) hits
+        JOIN posts p ON p.id = hits.post_id
+        JOIN users u ON p.user_id = u.id
+        WHERE p.is_blocked = FALSE 
+        AND u.is_blocked = FALSE
+        {hidden}
+        ORDER BY hits.score DESC, p.created_at DESC
+        LIMIT %s OFFSET %s
+    """
+    cursor.execute(q, (match, match, *hidden_params, limit, offset))
+    return cursor.fetchall()
+
+def search_songs(cursor, user_id, match, prefix_pattern, limit, offset):
+    if not match: return []
+    hidden, hidden_params = hidden_users_clause(cursor, user_id)
+    q = f"""
+        SELECT s.id, s.title, s.description, s.file_path, s.total_likes, s.created_at,
+               u.name as user_name, u.avatar as user_avatar, u.id as user_id
+        FROM songs s
+        JOIN users u ON s.user_id = u.id
+        WHERE MATCH(s.title, s.description) AGAINST (%s IN BOOLEAN MODE)
+        AND u.is_blocked = FALSE
+        {hidden}
+        ORDER BY MATCH(s.title, s.description) AGAINST (%s IN BOOLEAN MODE) DESC, s.created_at DESC
+        LIMIT %s OFFSET %s
+    """
+    cursor.execute(q, (match, *hidden_params, match, limit, offset))
+    return cursor.fetchall()
+
+def search_tags(cursor, user_id, match, prefix_pattern, limit, offset):
+    # Tag names are single words, so a prefix range scan on idx_name beats full-text here
+    q = """
+        SELECT t.id, t.name, COUNT(p.id) as post_count
+        FROM tags t
+        LEFT JOIN post_tags pt ON t.id = pt.tag_id
+        LEFT JOIN posts p ON pt.post_id = p.id AND p.is_blocked = FALSE
+        WHERE t.name LIKE %s
+        GROUP BY t.id, t.name
+        ORDER BY post_count DESC, t.name
+        LIMIT %s OFFSET %s
+    """
+    cursor.execute(q, (prefix_pattern, limit, offset))
+    return cursor.fetchall()
+
+SEARCHERS = {"users": search_users, "posts": search_posts, "songs": search_songs, "tags": search_tags}
+
+def set_like(cursor, user_id, post_id, action="toggle"):
+    """Like, unlike or toggle; returns (liked, total_likes) including unflushed counter deltas.
+
+    The unique (user_id, post_id) key makes the write idempotent and its rowcount says whether
+    the counter moves. The move is an appended delta, so likers never wait on the post's row lock;
+    one read afterwards returns the authoritative count and doubles as the post-exists check.
+    """
+    if action == "toggle":
+        q = "DELETE FROM likes WHERE user_id = %s AND post_id = %s"
+        cursor.execute(q, (user_id, post_id))
+        if cursor.rowcount: liked, delta = False, -1
+        else: action = "like"
+    if action == "like":
+        q = "INSERT IGNORE INTO likes (user_id, post_id) VALUES (%s, %s)"
+        cursor.execute(q, (user_id, post_id))
+        liked, delta = True, cursor.rowcount
+    elif action == "unlike":
+        q = "DELETE FROM likes WHERE user_id = %s AND post_id = %s"
+        cursor.execute(q, (user_id, post_id))
+        liked, delta = False, -cursor.rowcount
+    
+    if delta: x.add_to_counter(cursor, "post_likes", post_id, delta)
+    # INSERT IGNORE also swallows the foreign key error, so a missing post only shows up here
+    q = f"SELECT p.total_likes + {x.pending_counter_sql('post_likes', 'p.id')} as total_likes FROM posts p WHERE p.id = %s"
+    cursor.execute(q, (post_id,))
+    post = cursor.fetchone()
+    if not post: raise Exception("Post not found", 404)
+    return liked, max(int(post["total_likes"]), 0)
+
 def cleanup_db(cursor=None, db=None):
     if cursor: cursor.close()
-    if db: db.close()
+    if db: x.db_release(db)
 
 @app.route("/")
 @app.route("/<lan>")
@@ -148,92 +734,33 @@ def home(lan=None):
         user_id = user["id"]
         
         # Check if user is blocked
-        q = "SELECT is_blocked FROM users WHERE id = %s"
-        cursor.execute(q, (user_id,))
-        user_data = cursor.fetchone()
+        user_data = get_current_user_row()
         if user_data and user_data.get("is_blocked"):
             session.clear()
             return redirect(url_for("login"))
         
-        q = """
-            SELECT p.id, p.content, p.media_path, p.media_type, p.total_likes, p.created_at,
-                   u.id as user_id, u.name as user_name, u.avatar as user_avatar, p.user_id as post_owner_id,
-                   (SELECT COUNT(*) FROM likes WHERE post_id = p.id AND user_id = %s) as user_liked,
-                   (SELECT COUNT(*) FROM comments WHERE post_id = p.id) as comment_count,
-                   GROUP_CONCAT(DISTINCT t.name ORDER BY t.name SEPARATOR ', ') as tags
-            FROM posts p
-            JOIN users u ON p.user_id = u.id
-            LEFT JOIN post_tags pt ON p.id = pt.post_id
-            LEFT JOIN tags t ON pt.tag_id = t.id
-            WHERE p.is_blocked = FALSE 
-            AND u.is_blocked = FALSE
-            AND u.id NOT IN (
-                SELECT blocked_id FROM user_blocks WHERE blocker_id = %s
-                UNION
-                SELECT blocker_id FROM user_blocks WHERE blocked_id = %s
-            )
-            GROUP BY p.id
-            ORDER BY p.created_at DESC
-            LIMIT 50
-        """
-        cursor.execute(q, (user_id, user_id, user_id))
-        posts = cursor.fetchall()
-        
-        for post in posts:
-            q = """
-                SELECT c.id, c.content, c.created_at, u.name as user_name, u.avatar as user_avatar
-                FROM comments c
-                JOIN users u ON c.user_id = u.id
-                WHERE c.post_id = %s
-                ORDER BY c.created_at ASC
-            """
-            cursor.execute(q, (post["id"],))
-            post["comments"] = cursor.fetchall()
-        
-        q = "SELECT COUNT(*) as following_count FROM follows WHERE follower_id = %s"
+        q = "SELECT following_count, followers_count FROM users WHERE id = %s"
         cursor.execute(q, (user_id,))
-        following = cursor.fetchone()["following_count"]
+        counts = cursor.fetchone()
+        following = counts["following_count"]
+        followers = counts["followers_count"]
+        
+        page_q, page_params = resolve_page(cursor, *timeline_page_query(cursor, user_id))
+        etag = x.make_etag(
+            "home", lan, user.get("name"), user_data, following, followers, get_tag_stats(cursor),
+            page_version(cursor, user_id, page_q, page_params)
+        )
+        cached = x.not_modified(etag)
+        if cached: return cached
         
-        q = "SELECT COUNT(*) as followers_count FROM follows WHERE following_id = %s"
-        cursor.execute(q, (user_id,))
-        followers = cursor.fetchone()["followers_count"]
+        posts, next_cursor = fetch_post_page(cursor, user_id, page_q, page_params, x.FEED_PAGE_SIZE)
         
-        q = "SELECT avatar FROM users WHERE id = %s"
-        cursor.execute(q, (user_id,))
-        current_user = cursor.fetchone()
-        current_user_avatar = current_user["avatar"] if current_user else None
+        current_user_avatar = user_data["avatar"] if user_data else None
         
         # Get trending tags (tags used in most posts in last 7 days, randomized)
-        q = """
-            SELECT t.name, COUNT(pt.post_id) as post_count
-            FROM tags t
-            JOIN post_tags pt ON t.id = pt.tag_id
-            JOIN posts p ON pt.post_id = p.id
-            WHERE p.created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-            AND p.is_blocked = FALSE
-            GROUP BY t.id, t.name
-            ORDER BY post_count DESC, RAND()
-            LIMIT 5
-        """
-        cursor.execute(q)
-        trending_tags = cursor.fetchall()
+        trending_tags = get_trending_tags(cursor)
         
-        # If not enough recent tags, get overall trending tags
-        if len(trending_tags) < 3:
-            q = """
-                SELECT t.name, COUNT(pt.post_id) as post_count
-                FROM tags t
-                JOIN post_tags pt ON t.id = pt.tag_id
-                JOIN posts p ON pt.post_id = p.id
-                WHERE p.is_blocked = FALSE
-                GROUP BY t.id, t.name
-                ORDER BY post_count DESC, RAND()
-                LIMIT 5
-            """
-            cursor.execute(q)
-            trending_tags = cursor.fetchall()
-        
-        return render_template(
+        return x.revalidate(render_template(
             "home.html",
             posts=posts,
             user_name=user.get("name", ""),
@@ -242,9 +769,10 @@ def home(lan=None):
             followers=followers,
             current_user_avatar=current_user_avatar,
             trending_tags=trending_tags,
+            next_cursor=next_cursor,
             is_admin=is_admin(),
             lan=lan
-        )
+        ), etag)
     except Exception as ex:
         ic(ex)
         return render_template("home.html", posts=[], user_name=user.get("name", ""), error="Error loading feed", lan=lan if 'lan' in locals() else "english"), 500
@@ -252,6 +780,230 @@ def home(lan=None):
         cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
 
 
+@app.route("/api/feed")
+def feed_page():
+    """Next page of a feed as rendered post cards, for infinite scroll."""
+    user_id = get_user_id()
+    if not user_id: return json_response({"error": "Not authenticated"}, 401)
+    
+    scope = request.args.get("scope", "home")
+    try:
+        before = x.decode_feed_cursor(request.args.get("cursor", ""))
+        db, cursor = x.db()
+        
+        if scope == "home":
+            page_q, page_params = timeline_page_query(cursor, user_id, before)
+        elif scope == "tag":
+            tag_name = request.args.get("tag_name", "").strip().lower()
+            if not tag_name: raise Exception("Missing tag_name", 400)
+            page_q, page_params = tag_page_query(cursor, user_id, tag_name, before)
+        elif scope == "profile":
+            profile_user_id = request.args.get("user_id", type=int)
+            if not profile_user_id: raise Exception("Missing user_id", 400)
+            q = "SELECT is_blocked FROM users WHERE id = %s"
+            cursor.execute(q, (profile_user_id,))
+            profile_user = cursor.fetchone()
+            if not profile_user or (profile_user["is_blocked"] and not is_admin()):
+                raise Exception("Profile not found", 404)
+            if profile_user_id in get_hidden_user_ids(cursor, user_id):
+                raise Exception("Profile not found", 404)
+            page_q, page_params = profile_page_query(profile_user_id, before)
+        else:
+            raise Exception("Invalid feed scope", 400)
+        
+        page_q, page_params = resolve_page(cursor, page_q, page_params)
+        etag = x.make_etag("feed", x.default_language, user_id, page_version(cursor, user_id, page_q, page_params))
+        cached = x.not_modified(etag)
+        if cached: return cached
+        
+        posts, next_cursor = fetch_post_page(cursor, user_id, page_q, page_params, x.FEED_PAGE_SIZE)
+        html = render_template("_post_list.html", posts=posts, user_id=user_id, show_edit=True)
+        return x.revalidate(json_response({"success": True, "html": html, "count": len(posts), "next_cursor": next_cursor}), etag)
+    except Exception as ex:
+        ic(ex)
+        if len(ex.args) >= 2 and ex.args[1] in (400, 404):
+            return json_response({"error": ex.args[0]}, ex.args[1])
+        return json_response({"error": "Failed to load feed"}, 500)
+    finally:
+        cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
+
+
+##############################
+@app.route("/media/<path:filename>")
+def stream_media(filename):
+    """Serve an uploaded track with Range, ETag and If-None-Match support so seeking fetches only the bytes it needs."""
+    file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    if '/' in filename or file_ext not in x.AUDIO_MIMETYPES: abort(404)
+    response = send_from_directory(
+        x.MEDIA_FOLDER, filename,
+        mimetype=x.AUDIO_MIMETYPES[file_ext],
+        conditional=True,
+        etag=True,
+        max_age=x.MEDIA_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route("/avatars/<filename>")
+def avatar_media(filename):
+    """Avatar variants are named by content hash, so they can be cached forever."""
+    if not re.match(x.REGEX_AVATAR_VARIANT, filename): abort(404)
+    response = send_from_directory(x.AVATAR_FOLDER, filename, max_age=x.MEDIA_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+##############################
+def upload_status(upload):
+    return {
+        "upload_id": upload["id"],
+        "received": upload["received_size"],
+        "total_size": upload["total_size"],
+        "chunk_size": x.UPLOAD_CHUNK_SIZE,
+        "complete": upload["received_size"] >= upload["total_size"]
+    }
+
+def get_upload_session(cursor, upload_id, user_id):
+    upload_id = x.validate_uuid4_without_dashes(upload_id)
+    q = "SELECT id, filename, total_size, received_size FROM upload_sessions WHERE id = %s AND user_id = %s"
+    cursor.execute(q, (upload_id, user_id))
+    upload = cursor.fetchone()
+    if not upload: raise Exception("Upload not found", 404)
+    return upload
+
+def claim_upload(cursor, upload_id, user_id):
+    """Move a completed upload into the media folder and return its media_path.
+
+    The file moves before the caller commits, so the audio worker never sees the post without it.
+    If the transaction fails, unclaim_uploads() moves it back for the restored upload session.
+    """
+    upload = get_upload_session(cursor, upload_id, user_id)
+    if upload["received_size"] < upload["total_size"]: raise Exception("Upload is not complete", 409)
+    filename = f"{user_id}_{uuid.uuid4().hex}_{upload['filename']}"
+    part_path, media_file = x.upload_part_path(upload["id"]), os.path.join(x.MEDIA_FOLDER, filename)
+    os.makedirs(x.MEDIA_FOLDER, exist_ok=True)
+    os.replace(part_path, media_file)
+    g.setdefault("claimed_uploads", []).append((media_file, part_path))
+    q = "DELETE FROM upload_sessions WHERE id = %s"
+    cursor.execute(q, (upload["id"],))
+    return filename
+
+def unclaim_uploads():
+    """Undo this request's claim_upload moves after its transaction failed, so the upload can be retried."""
+    for media_file, part_path in g.pop("claimed_uploads", []):
+        try:
+            os.replace(media_file, part_path)
+        except OSError as ex:
+            ic(ex)
+
+def upload_error(ex, message):
+    ic(ex)
+    if len(ex.args) >= 2 and ex.args[1] in (400, 404, 409, 413):
+        return json_response({"error": ex.args[0]}, ex.args[1])
+    return json_response({"error": message}, 500)
+
+@app.route("/uploads", methods=["POST"])
+def start_upload():
+    """Open an upload session; the client then PUTs chunks in order and passes upload_id to /post."""
+    user_id = get_user_id()
+    if not user_id: return json_response({"error": "Not authenticated"}, 401)
+    
+    try:
+        filename = secure_filename(request.form.get("filename", ""))
+        file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        if file_ext not in x.AUDIO_MIMETYPES:
+            return json_response({"error": "Invalid audio file format"}, 400)
+        total_size = x.validate_upload_size(request.form.get("size", ""))
+        
+        db, cursor = x.db()
+        upload_id = uuid.uuid4().hex
+        os.makedirs(x.UPLOAD_PARTS_FOLDER, exist_ok=True)
+        open(x.upload_part_path(upload_id), "wb").close()
+        q = "INSERT INTO upload_sessions (id, user_id, filename, total_size) VALUES (%s, %s, %s, %s)"
+        cursor.execute(q, (upload_id, user_id, filename, total_size))
+        db.commit()
+        
+        return json_response(upload_status({"id": upload_id, "total_size": total_size, "received_size": 0}), 201)
+    except Exception as ex:
+        return upload_error(ex, "Failed to start upload")
+    finally:
+        cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
+
+
+@app.route("/uploads/<upload_id>", methods=["GET"])
+def get_upload(upload_id):
+    """How many bytes the server has, so an interrupted client knows where to resume."""
+    user_id = get_user_id()
+    if not user_id: return json_response({"error": "Not authenticated"}, 401)
+    
+    try:
+        db, cursor = x.db()
+        return json_response(upload_status(get_upload_session(cursor, upload_id, user_id)))
+    except Exception as ex:
+        return upload_error(ex, "Failed to load upload")
+    finally:
+        cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
+
+
+@app.route("/uploads/<upload_id>", methods=["PUT"])
+def upload_chunk(upload_id):
+    """Append the raw request body at ?offset=, streaming it to disk without buffering the chunk."""
+    user_id = get_user_id()
+    if not user_id: return json_response({"error": "Not authenticated"}, 401)
+    
+    try:
+        db, cursor = x.db()
+        upload = get_upload_session(cursor, upload_id, user_id)
+        try:
+            offset = int(request.args.get("offset", ""))
+        except ValueError:
+            return json_response({"error": "Invalid offset"}, 400)
+        if offset != upload["received_size"]:
+            return json_response({"error": "Offset does not match received bytes", **upload_status(upload)}, 409)
+        
+        length = request.content_length or 0
+        if length < 1 or length > x.UPLOAD_CHUNK_SIZE:
+            return json_response({"error": f"Chunks must be 1 to {x.UPLOAD_CHUNK_SIZE} bytes"}, 413)
+        if offset + length > upload["total_size"]:
+            return json_response({"error": "Chunk runs past the declared upload size"}, 400)
+        
+        written = 0
+        with open(x.upload_part_path(upload["id"]), "r+b") as part:
+            part.seek(offset)
+            part.truncate()
+            try:
+                if offset == 0:
+                    head = request.stream.read(min(length, 64))
+                    x.validate_audio_header(head, upload["filename"].rsplit('.', 1)[1].lower())
+                    part.write(head)
+                    written += len(head)
+                while written < length:
+                    block = request.stream.read(min(64 * 1024, length - written))
+                    if not block: break
+                    part.write(block)
+                    written += len(block)
+            except ClientDisconnected:
+                # Keep what arrived; the client resumes from the recorded offset
+                pass
+        
+        q = "UPDATE upload_sessions SET received_size = %s WHERE id = %s AND received_size = %s"
+        cursor.execute(q, (offset + written, upload["id"], offset))
+        if cursor.rowcount != 1:
+            db.rollback()
+            return json_response({"error": "Upload was modified concurrently", **upload_status(get_upload_session(cursor, upload_id, user_id))}, 409)
+        db.commit()
+        
+        upload["received_size"] = offset + written
+        return json_response(upload_status(upload))
+    except Exception as ex:
+        return upload_error(ex, "Failed to store chunk")
+    finally:
+        cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
+
+
 @app.route("/signup", methods=["GET", "POST"])
 @app.route("/signup/<lan>", methods=["GET", "POST"])
 def signup(lan="english"):
@@ -293,7 +1045,6 @@ def signup(lan="english"):
                 VALUES (%s, %s, %s, %s, %s, FALSE)
             """
             cursor.execute(q, (user_name, user_email, password_hash, user_avatar, user_bio))
-            db.commit()
             user_id = cursor.lastrowid
             
             expires_at = datetime.now() + timedelta(hours=24)
@@ -302,11 +1053,11 @@ def signup(lan="english"):
                 VALUES (%s, %s, %s)
             """
             cursor.execute(q, (user_id, verification_token, expires_at))
-            db.commit()
             
             verification_url = request.url_root.rstrip('/') + url_for('verify_account', key=verification_token)
             email_template = render_template("_email_verify_account.html", user_verification_key=verification_token, verification_url=verification_url)
-            x.send_email(user_email, "Verify your account", email_template)
+            x.send_email(cursor, user_email, "Verify your account", email_template)
+            db.commit()
             
             return redirect(url_for("verify_account", email=user_email))
 
@@ -438,9 +1189,7 @@ def create_post():
         db, cursor = x.db()
         
         # Verify user exists and is not blocked
-        q = "SELECT id, is_blocked FROM users WHERE id = %s"
-        cursor.execute(q, (user_id,))
-        user = cursor.fetchone()
+        user = get_current_user_row()
         
         if not user:
             session.clear()
@@ -452,9 +1201,10 @@ def create_post():
         
         content = request.form.get("content", "").strip()
         audio_file = request.files.get("audio_file")
+        upload_id = request.form.get("upload_id", "").strip()
         tags_input = request.form.get("tags", "").strip()
         
-        if not content and (not audio_file or not audio_file.filename):
+        if not content and not upload_id and (not audio_file or not audio_file.filename):
             return json_response({"error": "Please enter content or upload an audio file"}, 400) if is_ajax() else redirect(url_for("home"))
         if content and len(content) > 500:
             return json_response({"error": "Content must be 500 characters or less"}, 400) if is_ajax() else redirect(url_for("home"))
@@ -462,7 +1212,10 @@ def create_post():
         media_path = None
         media_type = None
         
-        if audio_file and audio_file.filename:
+        if upload_id:
+            media_path = claim_upload(cursor, upload_id, user_id)
+            media_type = "audio"
+        elif audio_file and audio_file.filename:
             allowed_extensions = {'mp3', 'wav', 'ogg', 'm4a', 'aac'}
             file_ext = audio_file.filename.rsplit('.', 1)[1].lower() if '.' in audio_file.filename else ''
             if file_ext not in allowed_extensions:
@@ -475,14 +1228,16 @@ def create_post():
             media_path = filename
             media_type = "audio"
         
+        # The worker picks up 'pending' audio and fills media_duration and media_peaks
         q = """
-            INSERT INTO posts (user_id, content, media_path, media_type)
-            VALUES (%s, %s, %s, %s)
+            INSERT INTO posts (user_id, content, media_path, media_type, media_status)
+            VALUES (%s, %s, %s, %s, %s)
         """
-        cursor.execute(q, (user_id, content if content else None, media_path, media_type))
+        cursor.execute(q, (user_id, content if content else None, media_path, media_type, "pending" if media_path else None))
         post_id = cursor.lastrowid
         
         # Process tags
+        linked_tags = []
         if tags_input:
             # Parse tags (comma-separated, remove # if present, trim whitespace)
             tag_names = [tag.strip().lstrip('#') for tag in tags_input.split(',') if tag.strip()]
@@ -503,12 +1258,21 @@ def create_post():
                     # Link tag to post
                     q = "INSERT IGNORE INTO post_tags (post_id, tag_id) VALUES (%s, %s)"
                     cursor.execute(q, (post_id, tag_id))
+                    if cursor.rowcount: linked_tags.append(tag_name.lower())
         
+        index_post_search(cursor, post_id)
+        adjust_post_count(cursor, user_id, 1)
+        fanout_post(cursor, post_id, user_id)
         db.commit()
+        g.pop("claimed_uploads", None)
+        x.tag_index.add(linked_tags)
         
         return json_response({"success": True, "message": "Post created"}) if is_ajax() else redirect(url_for("home"))
     except Exception as ex:
         ic(ex)
+        unclaim_uploads()
+        if len(ex.args) >= 2 and ex.args[1] in (400, 404, 409) and is_ajax():
+            return json_response({"error": ex.args[0]}, ex.args[1])
         return json_response({"error": "Failed to create post"}, 500) if is_ajax() else redirect(url_for("home"))
     finally:
         cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
@@ -520,38 +1284,48 @@ def toggle_like(post_id):
     if not user_id:
         return json_response({"error": "Not authenticated"}, 401) if is_ajax() else redirect(url_for("login"))
     
+    data = request.get_json(silent=True) or {}
+    action = data.get("action") or request.form.get("action") or "toggle"
+    if action not in ("like", "unlike", "toggle"):
+        return json_response({"error": "Invalid action"}, 400) if is_ajax() else redirect(url_for("home"))
+    
     try:
         db, cursor = x.db()
-        q = "SELECT id FROM likes WHERE user_id = %s AND post_id = %s"
-        cursor.execute(q, (user_id, post_id))
-        existing_like = cursor.fetchone()
-        
-        if existing_like:
-            q = "DELETE FROM likes WHERE user_id = %s AND post_id = %s"
-            cursor.execute(q, (user_id, post_id))
-            q = "UPDATE posts SET total_likes = total_likes - 1 WHERE id = %s"
-            cursor.execute(q, (post_id,))
-            liked = False
-        else:
-            q = "INSERT INTO likes (user_id, post_id) VALUES (%s, %s)"
-            cursor.execute(q, (user_id, post_id))
-            q = "UPDATE posts SET total_likes = total_likes + 1 WHERE id = %s"
-            cursor.execute(q, (post_id,))
-            liked = True
-        
-        q = "SELECT total_likes FROM posts WHERE id = %s"
-        cursor.execute(q, (post_id,))
-        total_likes = cursor.fetchone()["total_likes"]
+        liked, total_likes = set_like(cursor, user_id, post_id, action)
         db.commit()
+        invalidate_post_card(post_id)
         
         return json_response({"liked": liked, "total_likes": total_likes}) if is_ajax() else redirect(url_for("home"))
     except Exception as ex:
         ic(ex)
+        if len(ex.args) >= 2 and ex.args[1] == 404:
+            return json_response({"error": ex.args[0]}, 404) if is_ajax() else redirect(url_for("home"))
         return json_response({"error": "Failed to toggle like"}, 500) if is_ajax() else redirect(url_for("home"))
     finally:
         cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
 
 
+@app.route("/play/<int:post_id>", methods=["POST"])
+def record_play(post_id):
+    """Count one play of a post's audio; the player calls this once per page view."""
+    if not get_user_id(): return json_response({"error": "Not authenticated"}, 401)
+    
+    try:
+        db, cursor = x.db()
+        # counter_deltas has no foreign key; a delta for a missing post would be flushed into nothing
+        q = "SELECT 1 FROM posts WHERE id = %s AND is_blocked = FALSE"
+        cursor.execute(q, (post_id,))
+        if not cursor.fetchone(): return json_response({"error": "Post not found"}, 404)
+        x.add_to_counter(cursor, "post_plays", post_id)
+        db.commit()
+        return json_response({"success": True})
+    except Exception as ex:
+        ic(ex)
+        return json_response({"error": "Failed to record play"}, 500)
+    finally:
+        cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
+
+
 @app.route("/comment/<int:post_id>", methods=["POST"])
 def add_comment(post_id):
     user_id = get_user_id()
@@ -582,6 +1356,7 @@ def add_comment(post_id):
             comment = cursor.fetchone()
         
         db.commit()
+        invalidate_post_card(post_id)
         
         if is_ajax():
             return json_response({
@@ -627,18 +1402,17 @@ def edit_post(post_id):
         media_path = post["media_path"]
         media_type = post["media_type"]
         audio_file = request.files.get("audio_file")
+        upload_id = request.form.get("upload_id", "").strip()
         
-        if audio_file and audio_file.filename:
+        if upload_id:
+            media_path = claim_upload(cursor, upload_id, user_id)
+            media_type = "audio"
+        elif audio_file and audio_file.filename:
             allowed_extensions = {'mp3', 'wav', 'ogg', 'm4a', 'aac'}
             file_ext = audio_file.filename.rsplit('.', 1)[1].lower() if '.' in audio_file.filename else ''
             if file_ext not in allowed_extensions:
                 return redirect(url_for("home"))
             
-            if media_path:
-                old_file_path = os.path.join("static", "uploads", media_path)
-                if os.path.exists(old_file_path):
-                    os.remove(old_file_path)
-            
             filename = f"{user_id}_{uuid.uuid4().hex}_{audio_file.filename}"
             upload_path = os.path.join("static", "uploads", filename)
             os.makedirs(os.path.dirname(upload_path), exist_ok=True)
@@ -653,12 +1427,20 @@ def edit_post(post_id):
         """
         cursor.execute(q, (content if content else None, media_path, media_type, post_id, user_id))
         
+        if media_path != post["media_path"]:
+            q = """
+                UPDATE posts SET media_status = 'pending', media_duration = NULL, media_peaks = NULL
+                WHERE id = %s
+            """
+            cursor.execute(q, (post_id,))
+        
         # Update tags
         # Remove all existing tags for this post
         q = "DELETE FROM post_tags WHERE post_id = %s"
         cursor.execute(q, (post_id,))
         
         # Add new tags
+        created_tags = []
         if tags_input:
             tag_names = [tag.strip().lstrip('#') for tag in tags_input.split(',') if tag.strip()]
             for tag_name in tag_names:
@@ -672,6 +1454,7 @@ def edit_post(post_id):
                         q = "INSERT INTO tags (name) VALUES (%s)"
                         cursor.execute(q, (tag_name.lower(),))
                         tag_id = cursor.lastrowid
+                        created_tags.append(tag_name.lower())
                     else:
                         tag_id = tag["id"]
                     
@@ -679,14 +1462,23 @@ def edit_post(post_id):
                     q = "INSERT IGNORE INTO post_tags (post_id, tag_id) VALUES (%s, %s)"
                     cursor.execute(q, (post_id, tag_id))
         
+        index_post_search(cursor, post_id)
         db.commit()
-        if cursor.rowcount != 1:
-            raise Exception("Failed to update post", 400)
+        g.pop("claimed_uploads", None)
+        invalidate_post_card(post_id)
+        # Only now: had the commit failed, the post would still point at the old file
+        if post["media_path"] and media_path != post["media_path"]:
+            old_file_path = os.path.join("static", "uploads", post["media_path"])
+            if os.path.exists(old_file_path):
+                os.remove(old_file_path)
+        # Re-linked existing tags keep their counts until the next reload; new ones are searchable now
+        x.tag_index.add(created_tags)
         
         return redirect(url_for("home"))
     except Exception as ex:
         ic(ex)
         if "db" in locals(): db.rollback()
+        unclaim_uploads()
         return redirect(url_for("home"))
     finally:
         cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
@@ -700,7 +1492,7 @@ def delete_post(post_id):
     
     try:
         db, cursor = x.db()
-        q = "SELECT id, media_path, user_id FROM posts WHERE id = %s"
+        q = "SELECT id, media_path, user_id, is_blocked FROM posts WHERE id = %s"
         cursor.execute(q, (post_id,))
         post = cursor.fetchone()
         
@@ -716,9 +1508,11 @@ def delete_post(post_id):
         
         q = "DELETE FROM posts WHERE id = %s AND user_id = %s"
         cursor.execute(q, (post_id, user_id))
-        db.commit()
         if cursor.rowcount != 1:
             raise Exception("Failed to delete post", 400)
+        if not post["is_blocked"]: adjust_post_count(cursor, user_id, -1)
+        db.commit()
+        invalidate_post_card(post_id)
         
         return json_response({"success": True, "message": "Post deleted"}) if is_ajax() else redirect(url_for("home"))
     except Exception as ex:
@@ -729,6 +1523,13 @@ def delete_post(post_id):
         cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
 
 
+def search_response(response, etag):
+    response = x.revalidate(response, etag)
+    # Same URL serves the page and the AJAX JSON
+    response.vary.add("X-Requested-With")
+    return response
+
+
 @app.route("/search")
 def search():
     user = get_user()
@@ -738,100 +1539,52 @@ def search():
     if not query: return redirect(url_for("home"))
     
     try:
+        page = x.validate_search_page(request.args.get("page", ""))
+        categories = list(x.SEARCH_LIMITS)
+        if request.args.get("type") in x.SEARCH_LIMITS:
+            categories = [request.args.get("type")]
+        
         db, cursor = x.db()
         user_id = user["id"]
-        search_pattern = f"%{query}%"
-        
-        # Get users, excluding those blocked by or blocking the current user
-        q = """
-            SELECT u.id, u.name, u.email, u.avatar 
-            FROM users u
-            WHERE (u.name LIKE %s OR u.email LIKE %s) 
-            AND u.is_blocked = FALSE
-            AND u.id NOT IN (
-                SELECT blocked_id FROM user_blocks WHERE blocker_id = %s
-                UNION
-                SELECT blocker_id FROM user_blocks WHERE blocked_id = %s
-            )
-            LIMIT 10
-        """
-        cursor.execute(q, (search_pattern, search_pattern, user_id, user_id))
-        users = cursor.fetchall()
-        
-        for user_item in users:
-            if user_item["id"] != user_id:
-                q = "SELECT id FROM follows WHERE follower_id = %s AND following_id = %s"
-                cursor.execute(q, (user_id, user_item["id"]))
-                user_item["is_following"] = cursor.fetchone() is not None
-        
-        # Search posts by content OR tags
-        q = """
-            SELECT DISTINCT p.id, p.content, p.media_path, p.media_type, p.total_likes, p.created_at, 
-                   u.name as user_name, u.avatar as user_avatar, u.id as user_id
-            FROM posts p
-            JOIN users u ON p.user_id = u.id
-            LEFT JOIN post_tags pt ON p.id = pt.post_id
-            LEFT JOIN tags t ON pt.tag_id = t.id
-            WHERE (p.content LIKE %s OR t.name LIKE %s)
-            AND p.is_blocked = FALSE 
-            AND u.is_blocked = FALSE
-            AND u.id NOT IN (
-                SELECT blocked_id FROM user_blocks WHERE blocker_id = %s
-                UNION
-                SELECT blocker_id FROM user_blocks WHERE blocked_id = %s
-            )
-            ORDER BY p.created_at DESC
-            LIMIT 20
-        """
-        cursor.execute(q, (search_pattern, search_pattern, user_id, user_id))
-        posts = cursor.fetchall()
-        
-        q = """
-            SELECT s.id, s.title, s.description, s.file_path, s.total_likes, s.created_at,
-                   u.name as user_name, u.avatar as user_avatar, u.id as user_id
-            FROM songs s
-            JOIN users u ON s.user_id = u.id
-            WHERE (s.title LIKE %s OR s.description LIKE %s)
-            AND u.is_blocked = FALSE
-            AND u.id NOT IN (
-                SELECT blocked_id FROM user_blocks WHERE blocker_id = %s
-                UNION
-                SELECT blocker_id FROM user_blocks WHERE blocked_id = %s
-            )
-            ORDER BY s.created_at DESC
-            LIMIT 20
-        """
-        cursor.execute(q, (search_pattern, search_pattern, user_id, user_id))
-        songs = cursor.fetchall()
-        
-        # Search tags
-        q = """
-            SELECT DISTINCT t.id, t.name, COUNT(pt.post_id) as post_count
-            FROM tags t
-            LEFT JOIN post_tags pt ON t.id = pt.tag_id
-            LEFT JOIN posts p ON pt.post_id = p.id
-            WHERE t.name LIKE %s
-            AND (p.id IS NULL OR p.is_blocked = FALSE)
-            GROUP BY t.id, t.name
-            ORDER BY post_count DESC
-            LIMIT 10
-        """
-        cursor.execute(q, (search_pattern,))
-        tags = cursor.fetchall()
+        match = x.fulltext_query(query)
+        prefix_pattern = query.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        
+        results = {"users": [], "posts": [], "songs": [], "tags": []}
+        has_more = {}
+        for category in categories:
+            limit = x.SEARCH_LIMITS[category]
+            rows = SEARCHERS[category](cursor, user_id, match, prefix_pattern, limit + 1, (page - 1) * limit)
+            has_more[category] = len(rows) > limit
+            results[category] = rows[:limit]
+        
+        users = results["users"]
+        other_ids = [user_item["id"] for user_item in users if user_item["id"] != user_id]
+        if other_ids:
+            placeholders = ", ".join(["%s"] * len(other_ids))
+            q = f"SELECT following_id FROM follows WHERE follower_id = %s AND following_id IN ({placeholders})"
+            cursor.execute(q, (user_id, *other_ids))
+            following_ids = {row["following_id"] for row in cursor.fetchall()}
+            for user_item in users:
+                if user_item["id"] != user_id:
+                    user_item["is_following"] = user_item["id"] in following_ids
+        
+        # Search hits have no cheap version, so this validator only saves rendering and the transfer
+        etag = x.make_etag("search", is_ajax(), x.default_language, user_id, get_current_user_row(), query, page, has_more, results)
+        cached = x.not_modified(etag)
+        if cached: return cached
         
         # Return JSON if AJAX request, otherwise render template
         if is_ajax():
-            return json_response({
+            return search_response(json_response({
                 "success": True,
                 "query": query,
-                "users": users,
-                "posts": posts,
-                "songs": songs,
-                "tags": tags,
+                "page": page,
+                "has_more": has_more,
+                **results,
                 "current_user_id": user_id
-            })
+            }), etag)
         
-        return render_template("search.html", query=query, users=users, posts=posts, songs=songs, tags=tags, current_user_id=user_id)
+        return search_response(render_template("search.html", query=query, page=page, has_more=has_more, **results, current_user_id=user_id), etag)
     except Exception as ex:
         ic(ex)
         if is_ajax():
@@ -851,22 +1604,10 @@ def toggle_follow(user_id):
         db, cursor = x.db()
         
         # Check if either user is blocked
-        q = "SELECT id FROM user_blocks WHERE (blocker_id = %s AND blocked_id = %s) OR (blocker_id = %s AND blocked_id = %s)"
-        cursor.execute(q, (user_id, follower_id, follower_id, user_id))
-        if cursor.fetchone():
+        if is_blocked_between(cursor, follower_id, user_id):
             return redirect(request.referrer or url_for("home"))
         
-        q = "SELECT id FROM follows WHERE follower_id = %s AND following_id = %s"
-        cursor.execute(q, (follower_id, user_id))
-        existing_follow = cursor.fetchone()
-        
-        if existing_follow:
-            q = "DELETE FROM follows WHERE follower_id = %s AND following_id = %s"
-            cursor.execute(q, (follower_id, user_id))
-        else:
-            q = "INSERT INTO follows (follower_id, following_id) VALUES (%s, %s)"
-            cursor.execute(q, (follower_id, user_id))
-        
+        toggle_follow_rows(cursor, follower_id, user_id)
         db.commit()
         return redirect(request.referrer or url_for("home"))
     except Exception as ex:
@@ -876,6 +1617,30 @@ def toggle_follow(user_id):
         cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
 
 
+@app.route("/api/tags")
+def tag_suggestions():
+    """Tag autocomplete: the most used tags starting with ?q=, from the in-memory prefix index."""
+    if not get_user_id(): return json_response({"error": "Not authenticated"}, 401)
+    
+    prefix = request.args.get("q", "").strip().lstrip("#").lower()
+    limit = max(1, min(request.args.get("limit", x.TAG_SUGGEST_LIMIT, type=int), 50))
+    try:
+        if x.tag_index.is_stale():
+            with x.tag_index.reloading() as should_load:
+                if should_load:
+                    db, cursor = x.db()
+                    x.tag_index.load(cursor)
+        response = make_response(jsonify({"success": True, "tags": x.tag_index.suggest(prefix, limit)}))
+        # Suggestions are the same for everyone and only drift slowly; let the browser reuse them briefly
+        response.headers["Cache-Control"] = "private, max-age=60"
+        return response
+    except Exception as ex:
+        ic(ex)
+        return json_response({"error": "Failed to load tags"}, 500)
+    finally:
+        cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
+
+
 @app.route("/explore")
 def explore():
     """Explore page - browse posts by tags"""
@@ -893,63 +1658,25 @@ def explore():
         db, cursor = x.db()
         user_id = user["id"]
         
+        # Get all popular tags
+        all_tags = get_tag_stats(cursor)["popular"][:50]
+        
+        page_q, page_params = resolve_page(cursor, *tag_page_query(cursor, user_id, tag_name)) if tag_name else (None, ())
+        etag = x.make_etag(
+            "explore", lan, user_id, get_current_user_row(), tag_name, all_tags,
+            page_version(cursor, user_id, page_q, page_params) if tag_name else None
+        )
+        cached = x.not_modified(etag)
+        if cached: return cached
+        
         if tag_name:
             # Show posts with specific tag
-            q = """
-                SELECT DISTINCT p.id, p.content, p.media_path, p.media_type, p.total_likes, p.created_at,
-                       u.id as user_id, u.name as user_name, u.avatar as user_avatar, p.user_id as post_owner_id,
-                       (SELECT COUNT(*) FROM likes WHERE post_id = p.id AND user_id = %s) as user_liked,
-                       (SELECT COUNT(*) FROM comments WHERE post_id = p.id) as comment_count,
-                       GROUP_CONCAT(DISTINCT t2.name ORDER BY t2.name SEPARATOR ', ') as tags
-                FROM posts p
-                JOIN users u ON p.user_id = u.id
-                JOIN post_tags pt ON p.id = pt.post_id
-                JOIN tags t ON pt.tag_id = t.id
-                LEFT JOIN post_tags pt2 ON p.id = pt2.post_id
-                LEFT JOIN tags t2 ON pt2.tag_id = t2.id
-                WHERE t.name = %s
-                AND p.is_blocked = FALSE 
-                AND u.is_blocked = FALSE
-                AND u.id NOT IN (
-                    SELECT blocked_id FROM user_blocks WHERE blocker_id = %s
-                    UNION
-                    SELECT blocker_id FROM user_blocks WHERE blocked_id = %s
-                )
-                GROUP BY p.id
-                ORDER BY p.created_at DESC
-                LIMIT 50
-            """
-            cursor.execute(q, (user_id, tag_name, user_id, user_id))
-            posts = cursor.fetchall()
-            
-            for post in posts:
-                q = """
-                    SELECT c.id, c.content, c.created_at, u.name as user_name, u.avatar as user_avatar
-                    FROM comments c
-                    JOIN users u ON c.user_id = u.id
-                    WHERE c.post_id = %s
-                    ORDER BY c.created_at ASC
-                """
-                cursor.execute(q, (post["id"],))
-                post["comments"] = cursor.fetchall()
+            posts, next_cursor = fetch_post_page(cursor, user_id, page_q, page_params, x.FEED_PAGE_SIZE)
         else:
-            posts = []
+            posts, next_cursor = [], None
         
-        # Get all popular tags
-        q = """
-            SELECT t.name, COUNT(pt.post_id) as post_count
-            FROM tags t
-            JOIN post_tags pt ON t.id = pt.tag_id
-            JOIN posts p ON pt.post_id = p.id
-            WHERE p.is_blocked = FALSE
-            GROUP BY t.id, t.name
-            ORDER BY post_count DESC
-            LIMIT 50
-        """
-        cursor.execute(q)
-        all_tags = cursor.fetchall()
-        
-        return render_template("explore.html", posts=posts, tag_name=tag_name, all_tags=all_tags, user_id=user_id, lan=lan)
+        response = render_template("explore.html", posts=posts, next_cursor=next_cursor, tag_name=tag_name, all_tags=all_tags, user_id=user_id, lan=lan)
+        return x.revalidate(response, etag)
     except Exception as ex:
         ic(ex)
         return render_template("explore.html", posts=[], tag_name=tag_name, all_tags=[], user_id=user_id, error="Error loading explore page", lan=lan if 'lan' in locals() else "english"), 500
@@ -977,17 +1704,18 @@ def toggle_user_block(user_id):
             q = "DELETE FROM user_blocks WHERE blocker_id = %s AND blocked_id = %s"
             cursor.execute(q, (blocker_id, user_id))
             # Also remove follow relationship if exists
-            q = "DELETE FROM follows WHERE (follower_id = %s AND following_id = %s) OR (follower_id = %s AND following_id = %s)"
-            cursor.execute(q, (blocker_id, user_id, user_id, blocker_id))
+            remove_follow(cursor, blocker_id, user_id)
+            remove_follow(cursor, user_id, blocker_id)
         else:
             # Block
             q = "INSERT INTO user_blocks (blocker_id, blocked_id) VALUES (%s, %s)"
             cursor.execute(q, (blocker_id, user_id))
             # Also remove follow relationship if exists
-            q = "DELETE FROM follows WHERE (follower_id = %s AND following_id = %s) OR (follower_id = %s AND following_id = %s)"
-            cursor.execute(q, (blocker_id, user_id, user_id, blocker_id))
+            remove_follow(cursor, blocker_id, user_id)
+            remove_follow(cursor, user_id, blocker_id)
         
         db.commit()
+        invalidate_block_sets(blocker_id, user_id)
         return redirect(request.referrer or url_for("home"))
     except Exception as ex:
         ic(ex)
@@ -1021,11 +1749,11 @@ def forgot_password():
             VALUES (%s, %s, %s)
         """
         cursor.execute(q, (user["id"], reset_token, expires_at))
-        db.commit()
         
         reset_url = request.url_root.rstrip('/') + url_for('reset_password', key=reset_token)
         email_template = render_template("_email_reset_password.html", user_name=user["name"], reset_url=reset_url)
-        x.send_email(email, "Reset your EchoVerse password", email_template)
+        x.send_email(cursor, email, "Reset your EchoVerse password", email_template)
+        db.commit()
         
         return redirect(url_for("verify_email", email=email, type="password_reset"))
     except Exception as ex:
@@ -1111,7 +1839,10 @@ def profile(profile_user_id=None):
             is_own_profile = (profile_user_id == current_user_id)
         
         # Check if profile user exists and is not blocked by admin
-        q = "SELECT id, name, email, avatar, bio, created_at, is_blocked FROM users WHERE id = %s"
+        q = """
+            SELECT id, name, email, avatar, bio, created_at, is_blocked, post_count, following_count, followers_count
+            FROM users WHERE id = %s
+        """
         cursor.execute(q, (profile_user_id,))
         user_data = cursor.fetchone()
         
@@ -1123,10 +1854,8 @@ def profile(profile_user_id=None):
         
         # Check if current user is blocked by profile user or vice versa
         if not is_own_profile:
-            q = "SELECT id FROM user_blocks WHERE (blocker_id = %s AND blocked_id = %s) OR (blocker_id = %s AND blocked_id = %s)"
-            cursor.execute(q, (profile_user_id, current_user_id, current_user_id, profile_user_id))
-            block_exists = cursor.fetchone()
-            if block_exists:
+            blocked, blocked_by = get_block_sets(cursor, current_user_id)
+            if profile_user_id in blocked or profile_user_id in blocked_by:
                 return redirect(url_for("home"))
         
         # Get follow status (if viewing another user's profile)
@@ -1136,57 +1865,34 @@ def profile(profile_user_id=None):
             q = "SELECT id FROM follows WHERE follower_id = %s AND following_id = %s"
             cursor.execute(q, (current_user_id, profile_user_id))
             is_following = cursor.fetchone() is not None
-            
-            q = "SELECT id FROM user_blocks WHERE blocker_id = %s AND blocked_id = %s"
-            cursor.execute(q, (current_user_id, profile_user_id))
-            is_blocked_by_viewer = cursor.fetchone() is not None
+            is_blocked_by_viewer = profile_user_id in blocked
         
-        q = "SELECT COUNT(*) as post_count FROM posts WHERE user_id = %s AND is_blocked = FALSE"
-        cursor.execute(q, (profile_user_id,))
-        post_count = cursor.fetchone()["post_count"]
-        
-        q = "SELECT COUNT(*) as following_count FROM follows WHERE follower_id = %s"
-        cursor.execute(q, (profile_user_id,))
-        following = cursor.fetchone()["following_count"]
-        
-        q = "SELECT COUNT(*) as followers_count FROM follows WHERE following_id = %s"
-        cursor.execute(q, (profile_user_id,))
-        followers = cursor.fetchone()["followers_count"]
+        post_count = user_data["post_count"]
+        following = user_data["following_count"]
+        followers = user_data["followers_count"]
         
-        q = """
-            SELECT p.id, p.content, p.media_path, p.media_type, p.total_likes, p.created_at,
-                   (SELECT COUNT(*) FROM likes WHERE post_id = p.id AND user_id = %s) as user_liked,
-                   (SELECT COUNT(*) FROM comments WHERE post_id = p.id) as comment_count
-            FROM posts p
-            WHERE p.user_id = %s AND p.is_blocked = FALSE
-            ORDER BY p.created_at DESC
-            LIMIT 50
-        """
-        cursor.execute(q, (current_user_id, profile_user_id))
-        posts = cursor.fetchall()
+        page_q, page_params = resolve_page(cursor, *profile_page_query(profile_user_id))
+        etag = x.make_etag(
+            "profile", lan, current_user_id, get_current_user_row(), user_data, is_following, is_blocked_by_viewer,
+            page_version(cursor, current_user_id, page_q, page_params)
+        )
+        cached = x.not_modified(etag)
+        if cached: return cached
         
-        for post in posts:
-            q = """
-                SELECT c.id, c.content, c.created_at, u.name as user_name, u.avatar as user_avatar
-                FROM comments c
-                JOIN users u ON c.user_id = u.id
-                WHERE c.post_id = %s
-                ORDER BY c.created_at ASC
-            """
-            cursor.execute(q, (post["id"],))
-            post["comments"] = cursor.fetchall()
+        posts, next_cursor = fetch_post_page(cursor, current_user_id, page_q, page_params, x.FEED_PAGE_SIZE)
         
-        return render_template("profile.html", 
+        return x.revalidate(render_template("profile.html", 
                              user=user_data, 
                              post_count=post_count, 
                              following=following, 
                              followers=followers, 
                              posts=posts,
+                             next_cursor=next_cursor,
                              is_own_profile=is_own_profile,
                              is_following=is_following,
                              is_blocked_by_viewer=is_blocked_by_viewer,
                              current_user_id=current_user_id,
-                             lan=lan)
+                             lan=lan), etag)
     except Exception as ex:
         ic(ex)
         return redirect(url_for("home"))
@@ -1208,6 +1914,7 @@ def update_name():
         q = "UPDATE users SET name = %s, updated_at = NOW() WHERE id = %s"
         cursor.execute(q, (new_name, user_id))
         db.commit()
+        invalidate_user_row(user_id)
         
         session["user_name"] = new_name
         user = get_user()
@@ -1248,11 +1955,11 @@ def update_email():
             VALUES (%s, %s, %s)
         """
         cursor.execute(q, (user_id, verification_token, expires_at))
-        db.commit()
         
         verification_url = request.url_root.rstrip('/') + url_for('verify_email_change', key=verification_token, email=new_email)
         email_template = render_template("_email_verify_email_change.html", user_name=session["user_name"], new_email=new_email, verification_url=verification_url)
-        x.send_email(new_email, "Verify your new email address", email_template)
+        x.send_email(cursor, new_email, "Verify your new email address", email_template)
+        db.commit()
         
         return redirect(url_for("verify_email", email=new_email, type="email_change"))
     except Exception as ex:
@@ -1277,16 +1984,13 @@ def update_avatar():
         if file_ext not in allowed_extensions:
             return redirect(url_for("profile"))
         
-        db, cursor = x.db()
-        filename = f"avatar_{user_id}_{uuid.uuid4().hex}.{file_ext}"
-        upload_path = os.path.join("static", "uploads", "avatars", filename)
-        os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-        avatar_file.save(upload_path)
+        avatar_path = x.make_avatar_variants(avatar_file.read())
         
-        avatar_path = f"uploads/avatars/{filename}"
+        db, cursor = x.db()
         q = "UPDATE users SET avatar = %s, updated_at = NOW() WHERE id = %s"
         cursor.execute(q, (avatar_path, user_id))
         db.commit()
+        invalidate_user_row(user_id)
         
         return redirect(url_for("profile"))
     except Exception as ex:
@@ -1310,6 +2014,7 @@ def update_bio():
         q = "UPDATE users SET bio = %s, updated_at = NOW() WHERE id = %s"
         cursor.execute(q, (bio if bio else None, user_id))
         db.commit()
+        invalidate_user_row(user_id)
         
         return redirect(url_for("profile"))
     except Exception as ex:
@@ -1337,11 +2042,11 @@ def change_password():
             VALUES (%s, %s, %s)
         """
         cursor.execute(q, (user_id, change_token, expires_at))
-        db.commit()
         
         change_url = request.url_root.rstrip('/') + url_for('reset_password', key=change_token)
         email_template = render_template("_email_reset_password.html", user_name=user_data["name"], reset_url=change_url)
-        x.send_email(user_data["email"], "Change your EchoVerse password", email_template)
+        x.send_email(cursor, user_data["email"], "Change your EchoVerse password", email_template)
+        db.commit()
         
         return redirect(url_for("verify_email", email=user_data["email"], type="password_change"))
     except Exception as ex:
@@ -1422,16 +2127,31 @@ def delete_account():
         q = "SELECT avatar FROM users WHERE id = %s"
         cursor.execute(q, (user_id,))
         user_data = cursor.fetchone()
-        if user_data and user_data["avatar"] and not user_data["avatar"].startswith("http"):
-            avatar_path = os.path.join("static", user_data["avatar"])
+        # Hashed variant sets are shared by everyone who uploaded the same image, so only legacy per-user files go
+        avatar = user_data["avatar"] if user_data else None
+        if avatar and not avatar.startswith("http") and not x.avatar_variant(avatar, x.AVATAR_SIZES[-1]):
+            avatar_path = os.path.join("static", avatar)
             if os.path.exists(avatar_path):
                 os.remove(avatar_path)
         
+        # Follows cascade away with the user; take them off the other users' counters first
+        q = """
+            UPDATE users SET followers_count = GREATEST(followers_count - 1, 0), updated_at = updated_at
+            WHERE id IN (SELECT following_id FROM follows WHERE follower_id = %s)
+        """
+        cursor.execute(q, (user_id,))
+        q = """
+            UPDATE users SET following_count = GREATEST(following_count - 1, 0), updated_at = updated_at
+            WHERE id IN (SELECT follower_id FROM follows WHERE following_id = %s)
+        """
+        cursor.execute(q, (user_id,))
+        
         q = "DELETE FROM users WHERE id = %s"
         cursor.execute(q, (user_id,))
         db.commit()
         if cursor.rowcount != 1:
             raise Exception("Failed to delete account", 400)
+        invalidate_user_row(user_id)
         
         session.clear()
         return redirect(url_for("landing_page"))
@@ -1500,7 +2220,11 @@ def toggle_block_user(user_id):
         new_blocked_status = not user["is_blocked"]
         q = "UPDATE users SET is_blocked = %s, updated_at = NOW() WHERE id = %s"
         cursor.execute(q, (new_blocked_status, user_id))
-        db.commit()
+        if new_blocked_status:
+            q = "DELETE FROM timelines WHERE author_id = %s"
+            cursor.execute(q, (user_id,))
+        else:
+            backfill_timelines(cursor, user_id)
         
         # Log admin action
         action = "block_user" if new_blocked_status else "unblock_user"
@@ -1509,7 +2233,6 @@ def toggle_block_user(user_id):
             VALUES (%s, %s, %s)
         """
         cursor.execute(q, (admin_id, action, user_id))
-        db.commit()
         
         # Send email notification
         if new_blocked_status:
@@ -1527,10 +2250,10 @@ def toggle_block_user(user_id):
                 action="unblocked"
             )
         
-        try:
-            x.send_email(user["email"], subject, email_template)
-        except Exception as email_ex:
-            ic(f"Failed to send email: {email_ex}")
+        # The block, its log entry and the notification commit together or not at all
+        x.send_email(cursor, user["email"], subject, email_template)
+        db.commit()
+        invalidate_user_row(user_id)
         
         return json_response({
             "success": True,
@@ -1572,9 +2295,14 @@ def toggle_block_post(post_id):
         
         # Toggle block status
         new_blocked_status = not post["is_blocked"]
-        q = "UPDATE posts SET is_blocked = %s, updated_at = NOW() WHERE id = %s"
-        cursor.execute(q, (new_blocked_status, post_id))
-        db.commit()
+        q = "UPDATE posts SET is_blocked = %s, updated_at = NOW() WHERE id = %s AND is_blocked = %s"
+        cursor.execute(q, (new_blocked_status, post_id, post["is_blocked"]))
+        if cursor.rowcount: adjust_post_count(cursor, post["user_id"], -1 if new_blocked_status else 1)
+        if new_blocked_status:
+            q = "DELETE FROM timelines WHERE post_id = %s"
+            cursor.execute(q, (post_id,))
+        else:
+            fanout_post(cursor, post_id, post["user_id"])
         
         # Log admin action
         action = "block_post" if new_blocked_status else "unblock_post"
@@ -1583,7 +2311,6 @@ def toggle_block_post(post_id):
             VALUES (%s, %s, %s)
         """
         cursor.execute(q, (admin_id, action, post_id))
-        db.commit()
         
         # Send email notification to post owner
         if new_blocked_status:
@@ -1603,10 +2330,10 @@ def toggle_block_post(post_id):
                 action="unblocked"
             )
         
-        try:
-            x.send_email(post["user_email"], subject, email_template)
-        except Exception as email_ex:
-            ic(f"Failed to send email: {email_ex}")
+        # The block, its log entry and the notification commit together or not at all
+        x.send_email(cursor, post["user_email"], subject, email_template)
+        db.commit()
+        invalidate_post_card(post_id)
         
         return json_response({
             "success": True,
@@ -1622,6 +2349,38 @@ def toggle_block_post(post_id):
         cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
 
 
+@app.route("/admin/db-pool", methods=["GET"])
+def db_pool_stats():
+    """Connection pool size, saturation and checkout wait times."""
+    if not is_admin():
+        return json_response({"error": "Unauthorized"}, 403)
+    return json_response({"success": True, "pool": x.db_pool().stats()})
+
+
+@app.route("/admin/query-stats", methods=["GET", "DELETE"])
+def query_stats():
+    """Queries and DB time per route in this worker process since it started; DELETE starts over."""
+    if not is_admin():
+        return json_response({"error": "Unauthorized"}, 403)
+    if request.method == "DELETE": x.query_stats.reset()
+    return json_response({"success": True, "slow_query_ms": x.SLOW_QUERY_MS, "routes": x.query_stats.snapshot()})
+
+
+@app.route("/admin/email-outbox", methods=["GET"])
+def email_outbox_stats():
+    """Email outbox queue depth, for alerting on a stuck or slow worker."""
+    if not is_admin():
+        return json_response({"error": "Unauthorized"}, 403)
+    try:
+        db, cursor = x.db()
+        return json_response({"success": True, "outbox": x.email_outbox_stats(cursor)})
+    except Exception as ex:
+        ic(ex)
+        return json_response({"error": str(ex)}, 500)
+    finally:
+        cleanup_db(cursor if "cursor" in locals() else None, db if "db" in locals() else None)
+
+
 @app.route("/admin/languages", methods=["GET"])
 def get_languages_from_sheet():
     """Get languages from Google Sheets and return as JSON."""
@@ -1757,8 +2516,9 @@ def sync_languages_from_sheet():
         json_data = json.dumps(data, ensure_ascii=False, indent=2)
         
         # Save data to the dictionary.json file
-        with open("dictionary.json", 'w', encoding='utf-8') as f:
+        with open(x.DICTIONARY_JSON_PATH, 'w', encoding='utf-8') as f:
             f.write(json_data)
+        x.catalog.load()
         
         return json_response({
             "success": True,
@@ -1780,5 +2540,28 @@ def logout():
     return redirect(url_for("landing_page"))
 
 
+##############################
+def warm_up():
+    """Compile every template, reload translations and build the tag index before serving.
+
+    Runs before the fork: the tag index is read over a connection of its own, closed again, so no
+    worker inherits a socket and each starts with the index in memory.
+    """
+    x.catalog.load()
+    for name in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(name)
+    try:
+        db = x.db_connect()
+        cursor = db.cursor(dictionary=True, buffered=True)
+        x.tag_index.load(cursor)
+    except Exception as ex:
+        # Not fatal: the first autocomplete request loads it once the database is up
+        ic(ex)
+    finally:
+        if "cursor" in locals(): cursor.close()
+        if "db" in locals(): db.close()
+
+
+# Development only; production runs gunicorn -c gunicorn.conf.py app:app
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=80, debug=True)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=80, debug=os.environ.get("FLASK_DEBUG") == "1")
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""Time rendering a feed page of post cards, with the fragment cache cold and warm.
+
+    python benchmarks/bench_post_cards.py [pages] [posts_per_page]
+
+Posts are synthetic (tags, a waveform, a few comments each), so no database is needed.
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import app
+import x
+
+
+def make_posts(count, viewer_id=1):
+    now = datetime.now()
+    posts = []
+    for i in range(count):
+        post_id = 1000 + i
+        posts.append({
+            "id": post_id, "content": f"New demo track {i}, mixed and mastered", "created_at": now,
+            "media_path": f"{post_id}.mp3", "media_type": "audio", "media_duration": 184, "media_peaks": [(i * 7 + n) % 100 for n in range(x.ANALYSIS_PEAKS)],
+            "total_likes": i * 3, "user_id": 2 + i % 5, "user_name": f"User {2 + i % 5}", "user_avatar": None,
+            "post_owner_id": viewer_id if i % 4 == 0 else 2 + i % 5, "user_liked": i % 3 == 0, "tags": "beats, demo, synth",
+            "comment_count": 3,
+            "comments": [
+                {"id": post_id * 10 + n, "post_id": post_id, "content": f"Comment {n}", "created_at": now, "user_name": f"User {n}", "user_avatar": None}
+                for n in range(3)
+            ],
+        })
+    return posts
+
+
+def render_pages(posts, pages, viewer_id=1):
+    start = time.perf_counter()
+    for _ in range(pages):
+        app.render_template("_post_list.html", posts=posts, user_id=viewer_id, show_edit=True)
+    return (time.perf_counter() - start) / pages * 1000
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    pages = int(args[0]) if args else 200
+    per_page = int(args[1]) if len(args) > 1 else x.FEED_PAGE_SIZE
+    posts = make_posts(per_page)
+    cache = getattr(x, "post_card_cache", None)
+
+    with app.app.test_request_context("/home"):
+        app.render_template("_post_list.html", posts=posts, user_id=1, show_edit=True)
+        if cache is None:
+            print(f"no fragment cache   {render_pages(posts, pages):8.3f} ms/page ({per_page} cards)")
+        else:
+            cold = []
+            for _ in range(pages):
+                cache.clear()
+                cold.append(render_pages(posts, 1))
+            print(f"cold fragment cache {sum(cold) / len(cold):8.3f} ms/page ({per_page} cards)")
+            print(f"warm fragment cache {render_pages(posts, pages):8.3f} ms/page ({per_page} cards)")
@@ -0,0 +1,195 @@
+"""Time the app's hot query paths against the current database, or against generated datasets of several sizes.
+
+    python benchmarks/bench_queries.py                                   benchmark whatever is loaded now
+    python benchmarks/bench_queries.py --scales 1000,10000 --reset       regenerate per scale (wipes the database)
+    python benchmarks/bench_queries.py --output new.json --compare old.json
+
+Each path runs through app.py's own functions, one fresh request context per iteration, so the
+numbers cover the same SQL and Python the routes run (minus templates). Results are JSON:
+{"meta": {...}, "results": {scale: {path: {"p50_ms", "p95_ms", "mean_ms", ...}}}}.
+--compare exits 1 when any path's p50 or p95 grew by more than --threshold against the old file.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import x
+import generate_data
+
+# Below this the ratio is noise, not a regression
+MIN_REGRESSION_MS = 0.5
+
+
+##############################
+def pick_sample(cursor):
+    """A busy viewer, a popular profile, a busy tag and a liked post to aim the paths at."""
+    q = "SELECT id FROM users WHERE is_blocked = FALSE ORDER BY following_count DESC LIMIT 1"
+    cursor.execute(q)
+    viewer = cursor.fetchone()
+    if not viewer: sys.exit("No users to benchmark; run generate_data.py first")
+    q = "SELECT id FROM users WHERE is_blocked = FALSE AND id != %s ORDER BY followers_count DESC LIMIT 1"
+    cursor.execute(q, (viewer["id"],))
+    profile = cursor.fetchone() or viewer
+    q = "SELECT name FROM tag_stats ORDER BY post_count DESC LIMIT 1"
+    cursor.execute(q)
+    tag = cursor.fetchone()
+    q = "SELECT id FROM posts WHERE is_blocked = FALSE ORDER BY total_likes DESC LIMIT 1"
+    cursor.execute(q)
+    post = cursor.fetchone()
+    return {"viewer_id": viewer["id"], "profile_id": profile["id"], "tag": tag["name"] if tag else "music", "post_id": post["id"] if post else None}
+
+def hot_paths(app, db, sample):
+    """Each path takes a cursor and does what its route does with it."""
+    viewer_id, profile_id, tag = sample["viewer_id"], sample["profile_id"], sample["tag"]
+    match = x.fulltext_query(tag)
+    prefix = f"{tag}%"
+
+    def home(cursor):
+        app.fetch_timeline_posts(cursor, viewer_id)
+        cursor.execute("SELECT following_count, followers_count FROM users WHERE id = %s", (viewer_id,))
+        cursor.fetchone()
+        app.get_trending_tags(cursor)
+
+    # What a revalidated home request costs when the browser's copy is still current (304)
+    def home_not_modified(cursor):
+        app.page_version(cursor, viewer_id, *app.resolve_page(cursor, *app.timeline_page_query(cursor, viewer_id)))
+
+    def explore(cursor):
+        app.fetch_tag_posts(cursor, viewer_id, tag)
+        app.get_tag_stats(cursor)
+
+    def profile(cursor):
+        cursor.execute("SELECT id, name, avatar, post_count, following_count, followers_count FROM users WHERE id = %s", (profile_id,))
+        cursor.fetchone()
+        app.get_block_sets(cursor, viewer_id)
+        cursor.execute("SELECT id FROM follows WHERE follower_id = %s AND following_id = %s", (viewer_id, profile_id))
+        cursor.fetchone()
+        app.fetch_profile_posts(cursor, viewer_id, profile_id)
+
+    def search(cursor):
+        for category, searcher in app.SEARCHERS.items():
+            searcher(cursor, viewer_id, match, prefix, x.SEARCH_LIMITS[category] + 1, 0)
+
+    # Writes run twice so the dataset is the same afterwards
+    def like_toggle(cursor):
+        app.set_like(cursor, viewer_id, sample["post_id"])
+        app.set_like(cursor, viewer_id, sample["post_id"])
+        db.commit()
+
+    def follow_toggle(cursor):
+        app.toggle_follow_rows(cursor, viewer_id, profile_id)
+        app.toggle_follow_rows(cursor, viewer_id, profile_id)
+        db.commit()
+
+    paths = {"home feed": home, "home 304": home_not_modified, "explore by tag": explore, "profile": profile, "search": search}
+    if sample["post_id"]: paths["like toggle"] = like_toggle
+    if profile_id != viewer_id: paths["follow toggle"] = follow_toggle
+    return paths
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        "iterations": len(timings),
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "min_ms": round(timings[0], 3),
+        "max_ms": round(timings[-1], 3),
+    }
+
+def run(iterations, warmup, cold=False):
+    """Benchmark the loaded dataset; returns {path: summary}."""
+    import app
+    results = {}
+    try:
+        db = x.db_connect()
+        cursor = db.cursor(dictionary=True, buffered=True)
+        sample = pick_sample(cursor)
+        print(f"sample {sample}", flush=True)
+        for name, path in hot_paths(app, db, sample).items():
+            timings = []
+            for i in range(warmup + iterations):
+                # Fresh context per iteration: g-level caches reset like they do per request
+                with app.app.test_request_context():
+                    if cold:
+                        x.block_cache.clear()
+                        x.tag_stats_cache.clear()
+                    start = time.perf_counter()
+                    path(cursor)
+                    elapsed = (time.perf_counter() - start) * 1000
+                if i >= warmup: timings.append(elapsed)
+            results[name] = summarize(timings)
+            print(f"{name:<16} p50 {results[name]['p50_ms']:>9.3f} ms   p95 {results[name]['p95_ms']:>9.3f} ms", flush=True)
+        return results
+    finally:
+        if "cursor" in locals(): cursor.close()
+        if "db" in locals(): db.close()
+
+def compare(new, old, threshold):
+    """Print paths that got slower than old by more than threshold (0.2 = 20%); returns how many did."""
+    regressions = 0
+    for scale, paths in new["results"].items():
+        for name, result in paths.items():
+            before = old.get("results", {}).get(scale, {}).get(name)
+            if not before: continue
+            for stat in ("p50_ms", "p95_ms"):
+                if result[stat] - before[stat] < MIN_REGRESSION_MS: continue
+                if result[stat] > before[stat] * (1 + threshold):
+                    regressions += 1
+                    print(f"REGRESSION {scale:<10} {name:<16} {stat} {before[stat]:.3f} -> {result[stat]:.3f} ms")
+    print(f"{regressions} regression(s) over {threshold:.0%}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="", help="comma-separated user counts to generate and benchmark in turn")
+    parser.add_argument("--reset", action="store_true", help="required with --scales: each scale wipes the database")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--cold", action="store_true", help="clear the in-process block and tag caches every iteration")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    scales = [int(scale) for scale in args.scales.split(",") if scale.strip()]
+    if scales and not args.reset: sys.exit("--scales regenerates the database for each size; pass --reset to confirm")
+
+    report = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "cold": args.cold,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "db_host": x.DB_HOST,
+        },
+        "results": {},
+    }
+    if scales:
+        for users in scales:
+            print(f"== {users} users", flush=True)
+            report["meta"][f"rows_{users}"] = generate_data.generate(users, seed=args.seed, wipe=True)
+            report["results"][str(users)] = run(args.iterations, args.warmup, args.cold)
+    else:
+        report["results"]["current"] = run(args.iterations, args.warmup, args.cold)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            sys.exit(1 if compare(report, json.load(file), args.threshold) else 0)
@@ -0,0 +1,77 @@
+"""Compare session backends on a read-only request and a session-writing request.
+
+    python benchmarks/bench_sessions.py [requests] [backend ...]
+
+The mariadb backend needs the database from docker-compose and is skipped when it is unreachable.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from flask import Flask, session
+import x
+
+
+def make_app(backend):
+    app = Flask(__name__)
+    app.secret_key = "bench-secret"
+    x.configure_sessions(app, backend)
+
+    @app.route("/login")
+    def login():
+        session["user"] = {"id": 1, "name": "Bench User"}
+        return "ok"
+
+    @app.route("/read")
+    def read():
+        return str(session.get("user", {}).get("id"))
+
+    @app.route("/write")
+    def write():
+        session["last_seen"] = time.time()
+        return "ok"
+
+    app.teardown_appcontext(x.db_teardown)
+    return app
+
+
+def timed(client, path, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get(path)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def bench(backend, requests):
+    client = make_app(backend).test_client()
+    client.get("/login")
+    client.get("/read")
+    return timed(client, "/read", requests), timed(client, "/write", requests)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    requests = int(args.pop(0)) if args and args[0].isdigit() else 2000
+    backends = args or ["filesystem", "cookie", "mariadb"]
+
+    x.SESSION_FILE_DIR = tempfile.mkdtemp(prefix="bench_sessions_")
+    try:
+        print(f"{'backend':<12}{'read us/req':>14}{'write us/req':>14}")
+        for backend in backends:
+            if backend == "mariadb":
+                try:
+                    x.db_connect().close()
+                except Exception as ex:
+                    print(f"{backend:<12}{'skipped (' + str(ex)[:40] + ')':>28}")
+                    continue
+            read_us, write_us = bench(backend, requests)
+            print(f"{backend:<12}{read_us:>14.1f}{write_us:>14.1f}")
+    finally:
+        shutil.rmtree(x.SESSION_FILE_DIR, ignore_errors=True)
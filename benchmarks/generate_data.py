@@ -0,0 +1,213 @@
+"""Load a local MariaDB with synthetic, realistically skewed data.
+
+    python benchmarks/generate_data.py --users 10000 --reset
+    python benchmarks/generate_data.py --users 10000 --posts 80000 --likes 400000 --reset --seed 7
+
+Volumes not given scale with --users (see RATIOS). Follower counts and post popularity follow a
+power law, so a few accounts have most followers and a few posts get most likes and comments.
+--reset TRUNCATEs every app table first; never point this at a database you care about.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import numpy as np
+from werkzeug.security import generate_password_hash
+import x
+
+# Rows per user for volumes not given explicitly
+RATIOS = {"posts": 5, "likes": 20, "follows": 15, "comments": 5, "blocks": 0.05}
+# Zipf exponents: higher means more skew towards the top ranks
+FOLLOW_SKEW = 1.1
+POST_SKEW = 1.2
+TAG_SKEW = 1.0
+BATCH_SIZE = 5000
+DAYS = 90
+
+WORDS = (
+    "music guitar piano drums bass synth vocals demo mix master beat loop jam live acoustic remix "
+    "cover track album single release studio session song melody chorus verse lyrics tour vinyl"
+).split()
+
+APP_TABLES = (
+    "counter_deltas", "sessions", "upload_sessions", "email_outbox", "tag_stats", "post_search", "timelines",
+    "post_tags", "tags", "admin_logs", "user_blocks", "follows", "likes", "comments", "songs", "posts",
+    "password_reset_tokens", "email_verification_tokens", "users",
+)
+
+
+##############################
+def zipf_choice(rng, n, size, skew):
+    """size draws from range(n), where rank r is picked with probability proportional to 1 / (r + 1) ** skew."""
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return rng.choice(n, size=size, p=weights / weights.sum())
+
+def unique_pairs(left, right):
+    """Drop self-pairs and duplicates from two aligned id arrays."""
+    pairs = np.stack([left, right], axis=1)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    return np.unique(pairs, axis=0)
+
+def insert_rows(cursor, db, q, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        cursor.executemany(q, rows[start:start + BATCH_SIZE])
+        db.commit()
+
+def reset(cursor, db):
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    for table in APP_TABLES:
+        cursor.execute(f"TRUNCATE TABLE {table}")
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    db.commit()
+
+
+##############################
+def generate(users, posts=None, tags=None, likes=None, follows=None, comments=None, blocks=None, seed=1, wipe=False, log=print):
+    """Generate one dataset; returns the row counts actually inserted."""
+    posts = posts if posts is not None else int(users * RATIOS["posts"])
+    likes = likes if likes is not None else int(users * RATIOS["likes"])
+    follows = follows if follows is not None else int(users * RATIOS["follows"])
+    comments = comments if comments is not None else int(users * RATIOS["comments"])
+    blocks = blocks if blocks is not None else int(users * RATIOS["blocks"])
+    tags = tags if tags is not None else max(50, users // 20)
+    rng = np.random.default_rng(seed)
+    now = datetime.now().replace(microsecond=0)
+    counts = {}
+
+    try:
+        db = x.db_connect()
+        cursor = db.cursor()
+        if wipe: reset(cursor, db)
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM users")
+        user_base = cursor.fetchone()[0]
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM posts")
+        post_base = cursor.fetchone()[0]
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM tags")
+        tag_base = cursor.fetchone()[0]
+        started = time.perf_counter()
+
+        # Users: one shared hash, hashing per row would dominate the run
+        password_hash = generate_password_hash("password")
+        joined = [now - timedelta(days=int(d)) for d in rng.integers(DAYS, 3 * DAYS, users)]
+        rows = [(f"User {user_base + i + 1}", f"user{user_base + i + 1}@bench.local", password_hash, True, joined[i])
+                for i in range(users)]
+        insert_rows(cursor, db, "INSERT INTO users (name, email, password_hash, is_verified, created_at) VALUES (%s, %s, %s, %s, %s)", rows)
+        counts["users"] = users
+        user_ids = np.arange(user_base + 1, user_base + users + 1)
+
+        # Follows: followee by power-law popularity, follower uniform
+        pairs = unique_pairs(rng.choice(user_ids, follows), user_ids[zipf_choice(rng, users, follows, FOLLOW_SKEW)])
+        insert_rows(cursor, db, "INSERT IGNORE INTO follows (follower_id, following_id) VALUES (%s, %s)", pairs.tolist())
+        counts["follows"] = len(pairs)
+
+        # Blocks: rare and uniform
+        pairs = unique_pairs(rng.choice(user_ids, blocks), rng.choice(user_ids, blocks))
+        insert_rows(cursor, db, "INSERT IGNORE INTO user_blocks (blocker_id, blocked_id) VALUES (%s, %s)", pairs.tolist())
+        counts["blocks"] = len(pairs)
+
+        # Posts: prolific authors are also the popular ones
+        authors = user_ids[zipf_choice(rng, users, posts, FOLLOW_SKEW / 2)]
+        ages = rng.integers(0, DAYS * 24 * 60 * 60, posts)
+        created = sorted(now - timedelta(seconds=int(age)) for age in ages)
+        lengths = rng.integers(3, 20, posts)
+        word_ids = rng.integers(0, len(WORDS), int(lengths.sum()))
+        rows, offset = [], 0
+        for i in range(posts):
+            content = " ".join(WORDS[w] for w in word_ids[offset:offset + lengths[i]])
+            offset += lengths[i]
+            rows.append((int(authors[i]), content, created[i]))
+        insert_rows(cursor, db, "INSERT INTO posts (user_id, content, created_at) VALUES (%s, %s, %s)", rows)
+        counts["posts"] = posts
+        post_ids = np.arange(post_base + 1, post_base + posts + 1)
+        # Rank posts by a random shuffle so "viral" is not just "oldest"
+        viral_order = rng.permutation(post_ids)
+
+        # Tags and post_tags: 0-3 tags per post, power-law tag popularity
+        insert_rows(cursor, db, "INSERT IGNORE INTO tags (name) VALUES (%s)", [(f"{WORDS[i % len(WORDS)]}{tag_base + i}",) for i in range(tags)])
+        cursor.execute("SELECT id FROM tags WHERE id > %s ORDER BY id", (tag_base,))
+        tag_ids = np.array([row[0] for row in cursor.fetchall()])
+        per_post = rng.integers(0, 4, posts)
+        pairs = unique_pairs(np.repeat(post_ids, per_post), tag_ids[zipf_choice(rng, len(tag_ids), int(per_post.sum()), TAG_SKEW)])
+        insert_rows(cursor, db, "INSERT IGNORE INTO post_tags (post_id, tag_id) VALUES (%s, %s)", pairs.tolist())
+        counts["post_tags"] = len(pairs)
+
+        # Likes and comments: a few viral posts take most of them
+        pairs = unique_pairs(rng.choice(user_ids, likes), viral_order[zipf_choice(rng, posts, likes, POST_SKEW)])
+        insert_rows(cursor, db, "INSERT IGNORE INTO likes (user_id, post_id) VALUES (%s, %s)", pairs.tolist())
+        counts["likes"] = len(pairs)
+
+        commenters = rng.choice(user_ids, comments)
+        targets = viral_order[zipf_choice(rng, posts, comments, POST_SKEW)]
+        rows = [(int(commenters[i]), int(targets[i]), " ".join(rng.choice(WORDS, 6)), now - timedelta(seconds=int(s)))
+                for i, s in enumerate(rng.integers(0, DAYS * 24 * 60 * 60, comments))]
+        insert_rows(cursor, db, "INSERT INTO comments (user_id, post_id, content, created_at) VALUES (%s, %s, %s, %s)", rows)
+        counts["comments"] = comments
+        log(f"base rows loaded in {time.perf_counter() - started:.1f}s: {counts}")
+
+        rebuild_derived(cursor, db, user_base, post_base)
+        log(f"derived tables rebuilt, total {time.perf_counter() - started:.1f}s")
+        return counts
+    finally:
+        if "cursor" in locals(): cursor.close()
+        if "db" in locals(): db.close()
+
+def rebuild_derived(cursor, db, user_base, post_base):
+    """Fill the tables the app maintains on write, the same way the app and worker would."""
+    q = "UPDATE posts p SET total_likes = (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.id), updated_at = updated_at WHERE p.id > %s"
+    cursor.execute(q, (post_base,))
+    q = """
+        UPDATE users u SET
+            post_count = (SELECT COUNT(*) FROM posts p WHERE p.user_id = u.id AND p.is_blocked = FALSE),
+            following_count = (SELECT COUNT(*) FROM follows f WHERE f.follower_id = u.id),
+            followers_count = (SELECT COUNT(*) FROM follows f WHERE f.following_id = u.id),
+            updated_at = updated_at
+    """
+    cursor.execute(q)
+    q = "UPDATE users SET timeline_pull = TRUE WHERE followers_count > %s"
+    cursor.execute(q, (x.TIMELINE_FANOUT_LIMIT,))
+    db.commit()
+
+    # Timelines: own posts plus fan-out for authors under the fan-out limit
+    q = """
+        INSERT IGNORE INTO timelines (user_id, post_id, author_id, created_at)
+        SELECT f.follower_id, p.id, p.user_id, p.created_at
+        FROM posts p
+        JOIN users u ON u.id = p.user_id AND u.timeline_pull = FALSE
+        JOIN follows f ON f.following_id = p.user_id
+        WHERE p.id > %s AND p.is_blocked = FALSE
+        UNION ALL
+        SELECT p.user_id, p.id, p.user_id, p.created_at FROM posts p WHERE p.id > %s AND p.is_blocked = FALSE
+    """
+    cursor.execute(q, (post_base, post_base))
+    q = """
+        INSERT IGNORE INTO post_search (post_id, body)
+        SELECT p.id, CONCAT_WS(' ', p.content, GROUP_CONCAT(t.name SEPARATOR ' '))
+        FROM posts p
+        LEFT JOIN post_tags pt ON p.id = pt.post_id
+        LEFT JOIN tags t ON pt.tag_id = t.id
+        WHERE p.id > %s
+        GROUP BY p.id
+    """
+    cursor.execute(q, (post_base,))
+    db.commit()
+
+    import worker
+    worker.refresh_tag_stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    for name in ("posts", "tags", "likes", "follows", "comments", "blocks"):
+        parser.add_argument(f"--{name}", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reset", action="store_true", help="TRUNCATE all app tables first")
+    args = parser.parse_args()
+    generate(args.users, args.posts, args.tags, args.likes, args.follows, args.comments, args.blocks, seed=args.seed, wipe=args.reset)
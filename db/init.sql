@@ -18,8 +18,14 @@ CREATE TABLE IF NOT EXISTS users (
     role ENUM('user', 'admin') DEFAULT 'user',
     is_verified BOOLEAN DEFAULT FALSE,
     is_blocked BOOLEAN DEFAULT FALSE,
+    timeline_pull BOOLEAN DEFAULT FALSE, -- too many followers to fan out; followers pull at read time
+    -- Maintained by the app; worker.py's user_counters job recounts them
+    post_count INT DEFAULT 0,
+    following_count INT DEFAULT 0,
+    followers_count INT DEFAULT 0,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FULLTEXT INDEX ft_users_search (name, email)
 );
 
 -- ============================================
@@ -30,6 +36,7 @@ CREATE TABLE IF NOT EXISTS email_verification_tokens (
     user_id INT NOT NULL,
     token VARCHAR(255) NOT NULL,
     expires_at DATETIME NOT NULL,
+    INDEX idx_email_verification_token (token),
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
@@ -41,6 +48,7 @@ CREATE TABLE IF NOT EXISTS password_reset_tokens (
     user_id INT NOT NULL,
     token VARCHAR(255) NOT NULL,
     expires_at DATETIME NOT NULL,
+    INDEX idx_password_reset_token (token),
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
@@ -53,10 +61,17 @@ CREATE TABLE IF NOT EXISTS posts (
     content TEXT,
     media_path VARCHAR(255),
     media_type ENUM('image','video','audio','file') DEFAULT NULL,
+    media_status ENUM('pending','ready','failed') DEFAULT NULL,
+    media_duration INT DEFAULT NULL,
+    media_peaks TEXT DEFAULT NULL,
     total_likes INT DEFAULT 0,
+    total_plays INT DEFAULT 0,
     is_blocked BOOLEAN DEFAULT FALSE,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_posts_created (created_at),
+    INDEX idx_posts_user_created (user_id, created_at),
+    INDEX idx_posts_media_status (media_status),
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
 
@@ -76,7 +91,8 @@ CREATE TABLE IF NOT EXISTS songs (
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-    FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE SET NULL
+    FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE SET NULL,
+    FULLTEXT INDEX ft_songs_search (title, description)
 );
 
 -- ============================================
@@ -91,6 +107,7 @@ CREATE TABLE IF NOT EXISTS comments (
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    INDEX idx_comments_post_created (post_id, created_at),
     FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE,
     FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE
 ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
@@ -109,7 +126,10 @@ CREATE TABLE IF NOT EXISTS likes (
     FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE,
     FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE,
     FOREIGN KEY (comment_id) REFERENCES comments(id) ON DELETE CASCADE,
-    UNIQUE KEY unique_like (user_id, post_id, song_id, comment_id)
+    UNIQUE KEY unique_like (user_id, post_id, song_id, comment_id),
+    -- NULL song_id/comment_id make unique_like non-unique for post likes; this one enforces it
+    UNIQUE KEY unique_post_like (user_id, post_id),
+    INDEX idx_likes_post_user (post_id, user_id)
 );
 
 -- ============================================
@@ -122,7 +142,8 @@ CREATE TABLE IF NOT EXISTS follows (
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (follower_id) REFERENCES users(id) ON DELETE CASCADE,
     FOREIGN KEY (following_id) REFERENCES users(id) ON DELETE CASCADE,
-    UNIQUE KEY unique_follow (follower_id, following_id)
+    UNIQUE KEY unique_follow (follower_id, following_id),
+    INDEX idx_follows_following (following_id, follower_id)
 );
 
 -- ============================================
@@ -135,7 +156,8 @@ CREATE TABLE IF NOT EXISTS user_blocks (
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (blocker_id) REFERENCES users(id) ON DELETE CASCADE,
     FOREIGN KEY (blocked_id) REFERENCES users(id) ON DELETE CASCADE,
-    UNIQUE KEY unique_block (blocker_id, blocked_id)
+    UNIQUE KEY unique_block (blocker_id, blocked_id),
+    INDEX idx_user_blocks_blocked (blocked_id, blocker_id)
 );
 
 -- ============================================
@@ -177,6 +199,101 @@ CREATE TABLE IF NOT EXISTS post_tags (
     INDEX idx_post_id (post_id),
     INDEX idx_tag_id (tag_id)
 );
+
+-- ============================================
+-- 14. Timelines (fan-out-on-write home feeds)
+-- ============================================
+CREATE TABLE IF NOT EXISTS timelines (
+    user_id INT NOT NULL,
+    post_id INT NOT NULL,
+    author_id INT NOT NULL,
+    created_at DATETIME NOT NULL, -- copy of posts.created_at
+    PRIMARY KEY (user_id, post_id),
+    INDEX idx_timeline_feed (user_id, created_at, post_id),
+    INDEX idx_timeline_author (author_id, user_id),
+    INDEX idx_timeline_post (post_id),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE,
+    FOREIGN KEY (author_id) REFERENCES users(id) ON DELETE CASCADE
+);
+-- ============================================
+-- 15. Post search index (post content + tag names, kept in sync by the app)
+-- ============================================
+CREATE TABLE IF NOT EXISTS post_search (
+    post_id INT PRIMARY KEY,
+    body TEXT NOT NULL,
+    FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE,
+    FULLTEXT INDEX ft_post_search_body (body)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- ============================================
+-- 16. Tag stats (rollup refreshed by worker.py)
+-- ============================================
+CREATE TABLE IF NOT EXISTS tag_stats (
+    tag_id INT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    post_count INT NOT NULL DEFAULT 0,
+    recent_post_count INT NOT NULL DEFAULT 0, -- posts in the last 7 days
+    refreshed_at DATETIME NOT NULL,
+    INDEX idx_tag_stats_posts (post_count),
+    INDEX idx_tag_stats_recent (recent_post_count),
+    FOREIGN KEY (tag_id) REFERENCES tags(id) ON DELETE CASCADE
+);
+
+-- ============================================
+-- 17. Email outbox (drained by worker.py)
+-- ============================================
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    to_email VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body MEDIUMTEXT NOT NULL,
+    status ENUM('pending', 'sending', 'sent', 'failed') DEFAULT 'pending',
+    attempts INT DEFAULT 0,
+    last_error TEXT DEFAULT NULL,
+    next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    locked_at DATETIME DEFAULT NULL,
+    sent_at DATETIME DEFAULT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_outbox_due (status, next_attempt_at)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- ============================================
+-- 18. Upload sessions (chunked, resumable audio uploads)
+-- ============================================
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id CHAR(32) PRIMARY KEY,
+    user_id INT NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    total_size BIGINT NOT NULL,
+    received_size BIGINT DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_upload_sessions_updated (updated_at),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- ============================================
+-- 19. Sessions (SESSION_BACKEND=mariadb; expired rows swept by worker.py)
+-- ============================================
+CREATE TABLE IF NOT EXISTS sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at DATETIME NOT NULL,
+    INDEX idx_sessions_expires (expires_at)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- ============================================
+-- 20. Counter deltas (write-behind for posts.total_likes/total_plays and songs.total_plays; flushed by worker.py)
+-- ============================================
+CREATE TABLE IF NOT EXISTS counter_deltas (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    counter VARCHAR(32) NOT NULL,
+    target_id INT NOT NULL,
+    delta INT NOT NULL,
+    INDEX idx_counter_deltas_target (counter, target_id, delta)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
 -- ============================================
 --  Dummy Data: Admin User
 -- ============================================
@@ -261,4 +378,46 @@ INSERT INTO comments (user_id, post_id, content) VALUES
 (3, 5, 'Beautiful track!'),
 (4, 7, 'This hits different!'),
 (5, 8, 'Jazz fusion is the way!'),
-(2, 9, 'So relaxing!');
\ No newline at end of file
+(2, 9, 'So relaxing!');
+
+-- ============================================
+--  Dummy Data: Timelines (fan out the seed posts)
+-- ============================================
+INSERT IGNORE INTO timelines (user_id, post_id, author_id, created_at)
+SELECT f.follower_id, p.id, p.user_id, p.created_at
+FROM posts p
+JOIN follows f ON f.following_id = p.user_id
+WHERE p.is_blocked = FALSE
+UNION ALL
+SELECT p.user_id, p.id, p.user_id, p.created_at
+FROM posts p
+WHERE p.is_blocked = FALSE;
+
+-- ============================================
+--  Dummy Data: Post search index
+-- ============================================
+INSERT INTO post_search (post_id, body)
+SELECT p.id, CONCAT_WS(' ', p.content, GROUP_CONCAT(t.name SEPARATOR ' '))
+FROM posts p
+LEFT JOIN post_tags pt ON p.id = pt.post_id
+LEFT JOIN tags t ON pt.tag_id = t.id
+GROUP BY p.id;
+
+-- ============================================
+--  Dummy Data: Tag stats
+-- ============================================
+INSERT INTO tag_stats (tag_id, name, post_count, recent_post_count, refreshed_at)
+SELECT t.id, t.name, COUNT(p.id), SUM(p.created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY)), NOW()
+FROM tags t
+JOIN post_tags pt ON t.id = pt.tag_id
+JOIN posts p ON pt.post_id = p.id
+WHERE p.is_blocked = FALSE
+GROUP BY t.id, t.name;
+
+-- ============================================
+--  Dummy Data: User counters
+-- ============================================
+UPDATE users u SET
+    post_count = (SELECT COUNT(*) FROM posts p WHERE p.user_id = u.id AND p.is_blocked = FALSE),
+    following_count = (SELECT COUNT(*) FROM follows f WHERE f.follower_id = u.id),
+    followers_count = (SELECT COUNT(*) FROM follows f WHERE f.following_id = u.id);
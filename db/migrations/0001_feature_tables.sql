@@ -0,0 +1,154 @@
+-- Catch up databases created from the original init.sql with the schema the app now expects.
+-- Fresh databases already have every table, column and index from init.sql, so the DDL is a no-op
+-- there; the backfill at the end still runs and recomputes counters, timelines and the search index
+-- from their source rows, which scans posts, likes, follows and users once.
+
+-- ============================================
+-- Columns and indexes on existing tables
+-- ============================================
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS timeline_pull BOOLEAN DEFAULT FALSE,
+    ADD COLUMN IF NOT EXISTS post_count INT DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS following_count INT DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS followers_count INT DEFAULT 0;
+CREATE FULLTEXT INDEX IF NOT EXISTS ft_users_search ON users (name, email);
+
+ALTER TABLE posts
+    ADD COLUMN IF NOT EXISTS media_status ENUM('pending','ready','failed') DEFAULT NULL AFTER media_type,
+    ADD COLUMN IF NOT EXISTS media_duration INT DEFAULT NULL AFTER media_status,
+    ADD COLUMN IF NOT EXISTS media_peaks TEXT DEFAULT NULL AFTER media_duration,
+    ADD COLUMN IF NOT EXISTS total_plays INT DEFAULT 0 AFTER total_likes;
+CREATE INDEX IF NOT EXISTS idx_posts_media_status ON posts (media_status);
+
+CREATE FULLTEXT INDEX IF NOT EXISTS ft_songs_search ON songs (title, description);
+
+-- unique_like never deduplicated post likes (NULL song_id/comment_id); drop duplicates before enforcing it
+DELETE l1 FROM likes l1
+JOIN likes l2 ON l1.user_id = l2.user_id AND l1.post_id = l2.post_id AND l1.id > l2.id;
+CREATE UNIQUE INDEX IF NOT EXISTS unique_post_like ON likes (user_id, post_id);
+
+-- ============================================
+-- 14. Timelines (fan-out-on-write home feeds)
+-- ============================================
+CREATE TABLE IF NOT EXISTS timelines (
+    user_id INT NOT NULL,
+    post_id INT NOT NULL,
+    author_id INT NOT NULL,
+    created_at DATETIME NOT NULL, -- copy of posts.created_at
+    PRIMARY KEY (user_id, post_id),
+    INDEX idx_timeline_feed (user_id, created_at, post_id),
+    INDEX idx_timeline_author (author_id, user_id),
+    INDEX idx_timeline_post (post_id),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE,
+    FOREIGN KEY (author_id) REFERENCES users(id) ON DELETE CASCADE
+);
+-- ============================================
+-- 15. Post search index (post content + tag names, kept in sync by the app)
+-- ============================================
+CREATE TABLE IF NOT EXISTS post_search (
+    post_id INT PRIMARY KEY,
+    body TEXT NOT NULL,
+    FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE,
+    FULLTEXT INDEX ft_post_search_body (body)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- ============================================
+-- 16. Tag stats (rollup refreshed by worker.py)
+-- ============================================
+CREATE TABLE IF NOT EXISTS tag_stats (
+    tag_id INT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    post_count INT NOT NULL DEFAULT 0,
+    recent_post_count INT NOT NULL DEFAULT 0, -- posts in the last 7 days
+    refreshed_at DATETIME NOT NULL,
+    INDEX idx_tag_stats_posts (post_count),
+    INDEX idx_tag_stats_recent (recent_post_count),
+    FOREIGN KEY (tag_id) REFERENCES tags(id) ON DELETE CASCADE
+);
+
+-- ============================================
+-- 17. Email outbox (drained by worker.py)
+-- ============================================
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    to_email VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body MEDIUMTEXT NOT NULL,
+    status ENUM('pending', 'sending', 'sent', 'failed') DEFAULT 'pending',
+    attempts INT DEFAULT 0,
+    last_error TEXT DEFAULT NULL,
+    next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    locked_at DATETIME DEFAULT NULL,
+    sent_at DATETIME DEFAULT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_outbox_due (status, next_attempt_at)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- ============================================
+-- 18. Upload sessions (chunked, resumable audio uploads)
+-- ============================================
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id CHAR(32) PRIMARY KEY,
+    user_id INT NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    total_size BIGINT NOT NULL,
+    received_size BIGINT DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_upload_sessions_updated (updated_at),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- ============================================
+-- 19. Sessions (SESSION_BACKEND=mariadb; expired rows swept by worker.py)
+-- ============================================
+CREATE TABLE IF NOT EXISTS sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at DATETIME NOT NULL,
+    INDEX idx_sessions_expires (expires_at)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- ============================================
+-- 20. Counter deltas (write-behind for posts.total_likes/total_plays and songs.total_plays; flushed by worker.py)
+-- ============================================
+CREATE TABLE IF NOT EXISTS counter_deltas (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    counter VARCHAR(32) NOT NULL,
+    target_id INT NOT NULL,
+    delta INT NOT NULL,
+    INDEX idx_counter_deltas_target (counter, target_id, delta)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- ============================================
+-- Backfill
+-- ============================================
+-- Net of unflushed post_likes deltas: the next flush adds them back, so each like counts exactly once
+UPDATE posts p SET
+    total_likes = (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.id)
+                - (SELECT COALESCE(SUM(cd.delta), 0) FROM counter_deltas cd WHERE cd.counter = 'post_likes' AND cd.target_id = p.id),
+    updated_at = updated_at;
+
+UPDATE users u SET
+    post_count = (SELECT COUNT(*) FROM posts p WHERE p.user_id = u.id AND p.is_blocked = FALSE),
+    following_count = (SELECT COUNT(*) FROM follows f WHERE f.follower_id = u.id),
+    followers_count = (SELECT COUNT(*) FROM follows f WHERE f.following_id = u.id),
+    updated_at = updated_at;
+
+INSERT IGNORE INTO timelines (user_id, post_id, author_id, created_at)
+SELECT f.follower_id, p.id, p.user_id, p.created_at
+FROM posts p
+JOIN follows f ON f.following_id = p.user_id
+WHERE p.is_blocked = FALSE
+UNION ALL
+SELECT p.user_id, p.id, p.user_id, p.created_at
+FROM posts p
+WHERE p.is_blocked = FALSE;
+
+INSERT IGNORE INTO post_search (post_id, body)
+SELECT p.id, CONCAT_WS(' ', p.content, GROUP_CONCAT(t.name SEPARATOR ' '))
+FROM posts p
+LEFT JOIN post_tags pt ON p.id = pt.post_id
+LEFT JOIN tags t ON pt.tag_id = t.id
+GROUP BY p.id;
@@ -0,0 +1,19 @@
+-- Indexes for the access paths the app actually uses.
+-- follows and user_blocks already have an implicit index on the single FK column;
+-- the composites below replace that role and also cover the reverse lookups.
+
+-- Home/explore feed keyset: ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_posts_created ON posts (created_at);
+-- Profile feed and post counts
+CREATE INDEX IF NOT EXISTS idx_posts_user_created ON posts (user_id, created_at);
+-- Latest comments per post (load_comments window)
+CREATE INDEX IF NOT EXISTS idx_comments_post_created ON comments (post_id, created_at);
+-- Likes per post
+CREATE INDEX IF NOT EXISTS idx_likes_post_user ON likes (post_id, user_id);
+-- Followers of a user (fanout, backfill, counters)
+CREATE INDEX IF NOT EXISTS idx_follows_following ON follows (following_id, follower_id);
+-- Who blocked a user (block sets)
+CREATE INDEX IF NOT EXISTS idx_user_blocks_blocked ON user_blocks (blocked_id, blocker_id);
+-- Verification and reset links
+CREATE INDEX IF NOT EXISTS idx_email_verification_token ON email_verification_tokens (token);
+CREATE INDEX IF NOT EXISTS idx_password_reset_token ON password_reset_tokens (token);
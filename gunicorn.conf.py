@@ -0,0 +1,44 @@
+"""Production server settings: gunicorn -c gunicorn.conf.py app:app
+
+The app is imported and warmed once in the master (templates compiled, translations and tag index loaded),
+then forked, so every worker starts with those in memory. No database connection survives the
+fork: the tag index is read over a connection closed before it, and each worker primes its own
+pool in post_fork.
+
+Each worker may hold up to DB_POOL_SIZE (default WEB_THREADS + 1) connections, so MariaDB needs
+max_connections above WEB_WORKERS * DB_POOL_SIZE plus the background worker and admin sessions.
+With the defaults that is at most 8 * 5 = 40, well under MariaDB's default of 151.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:80")
+# Capped by default: every worker brings its own connection pool (see above)
+workers = int(os.environ.get("WEB_WORKERS", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.environ.get("WEB_THREADS", 4))
+worker_class = "gthread"
+# Recycle workers so a slow leak can't grow forever; jitter keeps them from restarting together
+max_requests = int(os.environ.get("WEB_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("WEB_MAX_REQUESTS_JITTER", 200))
+timeout = int(os.environ.get("WEB_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+preload_app = True
+# Heartbeat files on tmpfs; a disk-backed /tmp in a container can stall workers into timeouts
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    import app
+    app.warm_up()
+    server.log.info("Warmed up: templates, translations and tag index")
+
+def post_fork(server, worker):
+    import x
+    try:
+        x.db_pool().prime(min(threads, x.DB_POOL_SIZE))
+    except Exception as ex:
+        # Not fatal: the pool opens connections on demand once the database is up
+        server.log.warning(f"Worker {worker.pid} could not prime the DB pool: {ex}")
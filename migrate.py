@@ -0,0 +1,187 @@
+"""Versioned schema migrations and an EXPLAIN check of the app's hot queries.
+
+    python migrate.py                 apply pending migrations from db/migrations/ in order
+    python migrate.py --status        list migrations and whether they are applied
+    python migrate.py --check         EXPLAIN the hot queries and flag full scans (exit 1 if any)
+
+Migrations are NNNN_name.sql files. Every statement must be idempotent (IF NOT EXISTS, INSERT IGNORE, ...),
+since DDL commits implicitly in MariaDB and a migration that fails halfway is simply run again.
+"""
+import hashlib
+import os
+import re
+import sys
+import time
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import x
+from icecream import ic
+ic.configureOutput(prefix=f'----- | ', includeContext=True)
+
+MIGRATIONS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db", "migrations")
+# Tables smaller than this are allowed a full scan; the optimizer prefers them on tiny tables anyway
+CHECK_MIN_ROWS = int(os.environ.get("CHECK_MIN_ROWS", 1000))
+
+
+##############################
+def connect(wait_seconds=60):
+    """Connect, waiting for MariaDB while docker-compose is still starting it."""
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        try:
+            return x.db_connect()
+        except Exception as ex:
+            if time.monotonic() >= deadline: raise
+            print(f"Waiting for database: {ex}", flush=True)
+            time.sleep(2)
+
+def split_statements(sql):
+    """Split a migration file on semicolons that end a line; full-line comments are dropped."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [statement.strip() for statement in re.split(r";\s*$", "\n".join(lines), flags=re.M) if statement.strip()]
+
+def load_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_FOLDER)):
+        match = re.match(r"^(\d{4})_\w+\.sql$", filename)
+        if not match: continue
+        with open(os.path.join(MIGRATIONS_FOLDER, filename), encoding="utf-8") as file:
+            sql = file.read()
+        migrations.append({"version": filename[:-4], "sql": sql, "checksum": hashlib.sha256(sql.encode()).hexdigest()})
+    return migrations
+
+def applied_migrations(cursor):
+    q = """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(255) PRIMARY KEY,
+            checksum CHAR(64) NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    cursor.execute(q)
+    cursor.execute("SELECT version, checksum, applied_at FROM schema_migrations")
+    return {row["version"]: row for row in cursor.fetchall()}
+
+
+##############################
+def migrate():
+    try:
+        db = connect()
+        cursor = db.cursor(dictionary=True, buffered=True)
+        applied = applied_migrations(cursor)
+        for migration in load_migrations():
+            if migration["version"] in applied: continue
+            print(f"Applying {migration['version']}", flush=True)
+            for statement in split_statements(migration["sql"]):
+                cursor.execute(statement)
+            q = "INSERT INTO schema_migrations (version, checksum) VALUES (%s, %s)"
+            cursor.execute(q, (migration["version"], migration["checksum"]))
+            db.commit()
+        print("Schema is up to date", flush=True)
+    finally:
+        if "cursor" in locals(): cursor.close()
+        if "db" in locals(): db.close()
+
+def status():
+    try:
+        db = connect()
+        cursor = db.cursor(dictionary=True, buffered=True)
+        applied = applied_migrations(cursor)
+        for migration in load_migrations():
+            row = applied.get(migration["version"])
+            if not row: state = "pending"
+            elif row["checksum"] != migration["checksum"]: state = f"applied {row['applied_at']} (file changed since)"
+            else: state = f"applied {row['applied_at']}"
+            print(f"{migration['version']:<40} {state}")
+    finally:
+        if "cursor" in locals(): cursor.close()
+        if "db" in locals(): db.close()
+
+
+##############################
+class RecordingCursor:
+    """Passes everything through to a real cursor and remembers each statement executed."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.statements = []
+
+    def execute(self, q, params=()):
+        self.statements.append((q, tuple(params)))
+        return self._cursor.execute(q, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+def hot_paths(app, sample):
+    """The read paths behind home, explore, profile, search and login, driven through app.py's own functions."""
+    user_id, tag, profile_id = sample["user_id"], sample["tag"], sample["profile_id"]
+    match, prefix = x.fulltext_query(tag) or "+music*", f"{tag}%"
+    return {
+        # First, since the feeds below reuse the block sets it caches on g
+        "block sets": lambda c: app.get_block_sets(c, user_id),
+        "home timeline": lambda c: app.fetch_timeline_posts(c, user_id),
+        "home feed": lambda c: app.fetch_home_posts(c, user_id),
+        "home validator": lambda c: app.page_version(c, user_id, *app.resolve_page(c, *app.timeline_page_query(c, user_id))),
+        "tag feed": lambda c: app.fetch_tag_posts(c, user_id, tag),
+        "profile feed": lambda c: app.fetch_profile_posts(c, user_id, profile_id),
+        "tag stats": lambda c: app.get_tag_stats(c),
+        "search users": lambda c: app.search_users(c, user_id, match, prefix, 10, 0),
+        "search posts": lambda c: app.search_posts(c, user_id, match, prefix, 20, 0),
+        "search songs": lambda c: app.search_songs(c, user_id, match, prefix, 20, 0),
+        "search tags": lambda c: app.search_tags(c, user_id, match, prefix, 10, 0),
+        "login": lambda c: c.execute("SELECT id, name, password_hash, is_verified, is_blocked FROM users WHERE email = %s", (sample["email"],)),
+        "follow check": lambda c: c.execute("SELECT id FROM follows WHERE follower_id = %s AND following_id = %s", (user_id, profile_id)),
+        "verify token": lambda c: c.execute("SELECT user_id FROM email_verification_tokens WHERE token = %s AND expires_at > NOW()", ("0" * 32,)),
+        "reset token": lambda c: c.execute("SELECT user_id FROM password_reset_tokens WHERE token = %s AND expires_at > NOW()", ("0" * 32,)),
+    }
+
+def check():
+    """Run each hot path, EXPLAIN every SELECT it issued and flag full scans of non-trivial tables."""
+    import app
+    flagged = 0
+    try:
+        db = connect()
+        cursor = db.cursor(dictionary=True, buffered=True)
+        q = """
+            SELECT u.id as user_id, u.email,
+                   (SELECT following_id FROM follows WHERE follower_id = u.id LIMIT 1) as profile_id,
+                   (SELECT name FROM tag_stats ORDER BY post_count DESC LIMIT 1) as tag
+            FROM users u ORDER BY u.following_count DESC LIMIT 1
+        """
+        cursor.execute(q)
+        sample = cursor.fetchone()
+        if not sample: sys.exit("No users to sample; seed the database first")
+        sample["profile_id"] = sample["profile_id"] or sample["user_id"]
+        sample["tag"] = sample["tag"] or "music"
+
+        with app.app.test_request_context():
+            x.block_cache.clear()
+            x.tag_stats_cache.clear()
+            for name, run in hot_paths(app, sample).items():
+                recorder = RecordingCursor(cursor)
+                run(recorder)
+                for statement, params in recorder.statements:
+                    if not statement.lstrip().upper().startswith(("SELECT", "WITH")): continue
+                    cursor.execute("EXPLAIN " + statement, params)
+                    for row in cursor.fetchall():
+                        table = row["table"] or ""
+                        full_scan = row["type"] in ("ALL", "index") and not table.startswith("<")
+                        if full_scan and (row["rows"] or 0) >= CHECK_MIN_ROWS:
+                            flagged += 1
+                            print(f"FULL SCAN  {name:<14} {table:<24} type={row['type']} rows={row['rows']} key={row['key']} {row['Extra'] or ''}")
+                print(f"checked    {name:<14} {len(recorder.statements)} statement(s)")
+    finally:
+        if "cursor" in locals(): cursor.close()
+        if "db" in locals(): db.close()
+    print(f"{flagged} full scan(s) over {CHECK_MIN_ROWS} rows")
+    return flagged
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if "--status" in args: status()
+    elif "--check" in args: sys.exit(1 if check() else 0)
+    else: migrate()
@@ -1,21 +1,9 @@
 // Tag autocomplete
-let allTags = [];
 let tagSuggestionsTimeout = null;
+// Server suggestions per typed prefix, so backspacing doesn't refetch
+const tagSuggestionsCache = new Map();
 
-// Load all tags on page load
-document.addEventListener('DOMContentLoaded', async function() {
-    try {
-        const response = await fetch('/api/tags');
-        if (response.ok) {
-            const data = await response.json();
-            if (data.success && data.tags) {
-                allTags = data.tags;
-            }
-        }
-    } catch (error) {
-        console.error('Error loading tags:', error);
-    }
-    
+document.addEventListener('DOMContentLoaded', function() {
     // Setup tag autocomplete for post creation
     const tagsInput = document.getElementById('tags-input');
     if (tagsInput) {
@@ -30,6 +18,21 @@ document.addEventListener('DOMContentLoaded', async function() {
     }
 });
 
+async function fetchTagSuggestions(prefix) {
+    if (tagSuggestionsCache.has(prefix)) return tagSuggestionsCache.get(prefix);
+    try {
+        const response = await fetch('/api/tags?q=' + encodeURIComponent(prefix));
+        if (!response.ok) return [];
+        const data = await response.json();
+        const tags = data.success && data.tags ? data.tags : [];
+        tagSuggestionsCache.set(prefix, tags);
+        return tags;
+    } catch (error) {
+        console.error('Error loading tags:', error);
+        return [];
+    }
+}
+
 function handleTagInput(event) {
     const input = event.target;
     const value = input.value;
@@ -44,22 +47,30 @@ function handleTagInput(event) {
     
     // Get the last tag being typed (after last comma)
     const parts = value.split(',').map(p => p.trim());
-    const currentTag = parts[parts.length - 1].toLowerCase();
+    const currentTag = parts[parts.length - 1].toLowerCase().replace(/^#/, '');
     
-    if (currentTag.length === 0 || allTags.length === 0) {
+    if (currentTag.length === 0) {
         suggestionsDiv.style.display = 'none';
         return;
     }
     
+    // Wait for a pause in typing before asking the server
+    tagSuggestionsTimeout = setTimeout(async () => {
+        const tags = await fetchTagSuggestions(currentTag);
+        // Input moved on while the request was in flight
+        if (input.value !== value) return;
+        showTagSuggestions(suggestionsDiv, parts, currentTag, tags);
+    }, 150);
+}
+
+function showTagSuggestions(suggestionsDiv, parts, currentTag, tags) {
     // Get already added tags (excluding the current one being typed)
     const existingTags = parts.slice(0, -1).map(t => t.toLowerCase());
     
-    // Filter tags that match and aren't already added
-    const matchingTags = allTags.filter(tag => {
+    // Drop tags that are already added or typed out in full
+    const matchingTags = tags.filter(tag => {
         const tagLower = tag.toLowerCase();
-        return tagLower.startsWith(currentTag) && 
-               !existingTags.includes(tagLower) &&
-               tagLower !== currentTag;
+        return !existingTags.includes(tagLower) && tagLower !== currentTag;
     }).slice(0, 5);
     
     if (matchingTags.length === 0) {
@@ -129,12 +140,15 @@ function cancelEdit(postId) {
 
 // Toggle like on a post using AJAX (no page reload)
 async function toggleLike(postId) {
+    // Send the intended state rather than "toggle", so a double click cannot flip it back
+    const action = document.getElementById('like-btn-' + postId)?.classList.contains('liked') ? 'unlike' : 'like';
     try {
         const response = await fetch(`/like/${postId}`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
+            body: JSON.stringify({ action: action }),
             credentials: 'same-origin'
         });
         
@@ -233,13 +247,13 @@ async function addComment(event, postId) {
                     // Append the new comment to the list
                     commentsList.appendChild(commentDiv);
                     
-                    // Update comment count by counting actual comments in the list
-                    const commentItems = commentsList.querySelectorAll('.comment-item');
-                    const actualCount = commentItems.length;
-                    
+                    // Update comment count; the list only holds a preview, so increment the rendered total
                     const commentCountSpan = document.getElementById(`comment-count-${postId}`);
                     const commentBtn = document.getElementById(`comment-btn-${postId}`);
                     
+                    const previousCount = parseInt((commentCountSpan?.textContent || '').replace(/\D/g, ''), 10) || 0;
+                    const actualCount = previousCount + 1;
+                    
                     if (commentCountSpan) {
                         commentCountSpan.textContent = `(${actualCount})`;
                     } else if (commentBtn) {
@@ -299,6 +313,48 @@ async function deletePost(postId) {
     }
 }
 
+// Send an audio file in chunks to /uploads, resuming from the server's offset after a failed chunk
+async function uploadInChunks(file, onProgress) {
+    const startData = new FormData();
+    startData.set('filename', file.name);
+    startData.set('size', file.size);
+    let response = await fetch('/uploads', { method: 'POST', body: startData, credentials: 'same-origin' });
+    let upload = await response.json();
+    if (!response.ok) throw new Error(upload.error || 'Failed to start upload');
+    
+    let retries = 0;
+    while (!upload.complete) {
+        try {
+            const chunk = file.slice(upload.received, upload.received + upload.chunk_size);
+            response = await fetch(`/uploads/${upload.upload_id}?offset=${upload.received}`, {
+                method: 'PUT',
+                body: chunk,
+                credentials: 'same-origin'
+            });
+            const data = await response.json();
+            if (response.ok || response.status === 409) {
+                upload = { ...upload, ...data };
+                retries = 0;
+                if (onProgress) onProgress(upload.received / upload.total_size);
+                continue;
+            }
+            if (response.status < 500) throw new Error(data.error || 'Upload failed');
+        } catch (error) {
+            if (!(error instanceof TypeError) && !(error instanceof SyntaxError)) throw error;
+        }
+        // Network error or server hiccup: wait, then ask the server where to resume
+        if (++retries > 5) throw new Error('Upload interrupted');
+        await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** retries));
+        try {
+            response = await fetch(`/uploads/${upload.upload_id}`, { credentials: 'same-origin' });
+            if (response.ok) upload = { ...upload, ...(await response.json()) };
+        } catch (error) {
+            console.error('Error resuming upload:', error);
+        }
+    }
+    return upload.upload_id;
+}
+
 // Submit post using AJAX (no page reload)
 document.addEventListener('DOMContentLoaded', function() {
     const postForm = document.getElementById('post-form');
@@ -326,10 +382,21 @@ document.addEventListener('DOMContentLoaded', function() {
                 return false;
             }
             
+            const submitButton = form.querySelector('button[type="submit"]');
+            const submitText = submitButton ? submitButton.textContent : '';
             try {
+                if (audioFile?.name) {
+                    const uploadId = await uploadInChunks(audioFile, function(progress) {
+                        if (submitButton) submitButton.textContent = `${Math.round(progress * 100)}%`;
+                    });
+                    formData.delete('audio_file');
+                    formData.set('upload_id', uploadId);
+                }
+                
                 const response = await fetch('/post', {
                     method: 'POST',
                     body: formData,
+                    headers: { 'X-Requested-With': 'XMLHttpRequest' },
                     credentials: 'same-origin'
                 });
                 
@@ -344,14 +411,70 @@ document.addEventListener('DOMContentLoaded', function() {
             } catch (error) {
                 console.error('Error creating post:', error);
                 const errorDiv = document.getElementById('post-error');
-                errorDiv.textContent = 'Error creating post';
+                errorDiv.textContent = error.message || 'Error creating post';
                 errorDiv.style.display = 'block';
+            } finally {
+                if (submitButton) submitButton.textContent = submitText;
             }
             return false;
         });
     }
 });
 
+// Count a play the first time each post's audio starts ("play" does not bubble, so listen in the capture phase)
+document.addEventListener('play', function(e) {
+    const player = e.target;
+    if (!player.classList?.contains('audio-player') || player.dataset.playCounted) return;
+    const postCard = player.closest('.post-card');
+    if (!postCard) return;
+    player.dataset.playCounted = '1';
+    fetch(`/play/${postCard.id.replace('post-', '')}`, {
+        method: 'POST',
+        headers: { 'X-Requested-With': 'XMLHttpRequest' },
+        credentials: 'same-origin'
+    }).catch(error => console.error('Error recording play:', error));
+}, true);
+
+// Infinite scroll: load the next feed page when the sentinel comes into view
+document.addEventListener('DOMContentLoaded', function() {
+    const sentinel = document.querySelector('.feed-more');
+    if (!sentinel || !('IntersectionObserver' in window)) return;
+    
+    let loading = false;
+    const observer = new IntersectionObserver(async function(entries) {
+        if (!entries.some(entry => entry.isIntersecting) || loading) return;
+        loading = true;
+        try {
+            const url = new URL(sentinel.dataset.feedUrl, window.location.origin);
+            url.searchParams.set('cursor', sentinel.dataset.cursor);
+            const response = await fetch(url, {
+                headers: { 'X-Requested-With': 'XMLHttpRequest' },
+                credentials: 'same-origin'
+            });
+            if (!response.ok) throw new Error('Failed to load feed');
+            
+            const data = await response.json();
+            sentinel.insertAdjacentHTML('beforebegin', data.html);
+            if (data.next_cursor) {
+                sentinel.dataset.cursor = data.next_cursor;
+                // Re-observe so a sentinel that is still on screen triggers the next page
+                observer.unobserve(sentinel);
+                observer.observe(sentinel);
+            } else {
+                observer.disconnect();
+                sentinel.remove();
+            }
+        } catch (error) {
+            console.error('Error loading feed:', error);
+            observer.disconnect();
+        } finally {
+            loading = false;
+        }
+    }, { rootMargin: '600px 0px' });
+    
+    observer.observe(sentinel);
+});
+
 // Live search functionality
 let searchTimeout;
 
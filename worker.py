@@ -0,0 +1,338 @@
+"""Background jobs that run outside the web workers.
+
+    python worker.py                  run every job on its schedule
+    python worker.py tag_stats        run only the named jobs on their schedule
+    python worker.py --once tag_stats run the named jobs (or all) once and exit
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import wave
+from datetime import datetime
+
+import numpy as np
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import x
+from icecream import ic
+ic.configureOutput(prefix=f'----- | ', includeContext=True)
+
+
+##############################
+def refresh_tag_stats():
+    """Recount posts per tag (all time and last 7 days) into the tag_stats rollup."""
+    try:
+        db, cursor = x.db()
+        refreshed_at = datetime.now().replace(microsecond=0)
+        q = """
+            REPLACE INTO tag_stats (tag_id, name, post_count, recent_post_count, refreshed_at)
+            SELECT t.id, t.name, COUNT(p.id), SUM(p.created_at >= DATE_SUB(%s, INTERVAL 7 DAY)), %s
+            FROM tags t
+            JOIN post_tags pt ON t.id = pt.tag_id
+            JOIN posts p ON pt.post_id = p.id
+            WHERE p.is_blocked = FALSE
+            GROUP BY t.id, t.name
+        """
+        cursor.execute(q, (refreshed_at, refreshed_at))
+
+        # Tags whose last visible post was deleted or blocked
+        q = "DELETE FROM tag_stats WHERE refreshed_at < %s"
+        cursor.execute(q, (refreshed_at,))
+        db.commit()
+        return "tag stats refreshed"
+    finally:
+        if "cursor" in locals(): cursor.close()
+        if "db" in locals(): db.close()
+
+
+##############################
+smtp_session = x.SmtpSession()
+
+def drain_email_outbox():
+    """Send due outbox emails in batches over one SMTP session, retrying failures with backoff."""
+    try:
+        db, cursor = x.db()
+        sent = failed = 0
+
+        # Rows left in 'sending' by a worker that died mid-batch
+        q = """
+            UPDATE email_outbox SET status = 'pending', locked_at = NULL
+            WHERE status = 'sending' AND locked_at < DATE_SUB(NOW(), INTERVAL 10 MINUTE)
+        """
+        cursor.execute(q)
+        q = "DELETE FROM email_outbox WHERE status = 'sent' AND sent_at < DATE_SUB(NOW(), INTERVAL 7 DAY) LIMIT 1000"
+        cursor.execute(q)
+        db.commit()
+
+        while True:
+            q = """
+                SELECT id, to_email, subject, body, attempts
+                FROM email_outbox
+                WHERE status = 'pending' AND next_attempt_at <= NOW()
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """
+            cursor.execute(q, (x.EMAIL_BATCH_SIZE,))
+            emails = cursor.fetchall()
+            if not emails:
+                db.commit()
+                break
+            ids = [email["id"] for email in emails]
+            q = f"UPDATE email_outbox SET status = 'sending', locked_at = NOW() WHERE id IN ({', '.join(['%s'] * len(ids))})"
+            cursor.execute(q, ids)
+            db.commit()
+
+            for email in emails:
+                try:
+                    smtp_session.send(email["to_email"], x.build_email(email["to_email"], email["subject"], email["body"]))
+                    q = "UPDATE email_outbox SET status = 'sent', sent_at = NOW(), locked_at = NULL WHERE id = %s"
+                    cursor.execute(q, (email["id"],))
+                    sent += 1
+                except Exception as ex:
+                    ic(ex)
+                    smtp_session.close()
+                    attempts = email["attempts"] + 1
+                    status = "failed" if attempts >= x.EMAIL_MAX_ATTEMPTS else "pending"
+                    delay = x.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+                    q = """
+                        UPDATE email_outbox
+                        SET status = %s, attempts = %s, last_error = %s, locked_at = NULL,
+                            next_attempt_at = DATE_ADD(NOW(), INTERVAL %s SECOND)
+                        WHERE id = %s
+                    """
+                    cursor.execute(q, (status, attempts, str(ex)[:1000], delay, email["id"]))
+                    failed += 1
+                db.commit()
+        return {"sent": sent, "failed": failed} if sent or failed else None
+    finally:
+        if "cursor" in locals(): cursor.close()
+        if "db" in locals(): db.close()
+
+##############################
+def purge_upload_sessions():
+    """Delete chunked uploads that were abandoned before a post claimed them, with their part files."""
+    try:
+        db, cursor = x.db()
+        q = "SELECT id FROM upload_sessions WHERE updated_at < DATE_SUB(NOW(), INTERVAL %s HOUR)"
+        cursor.execute(q, (x.UPLOAD_SESSION_HOURS,))
+        ids = [upload["id"] for upload in cursor.fetchall()]
+        if not ids: return None
+        
+        for upload_id in ids:
+            try:
+                os.remove(x.upload_part_path(upload_id))
+            except FileNotFoundError:
+                pass
+        q = f"DELETE FROM upload_sessions WHERE id IN ({', '.join(['%s'] * len(ids))})"
+        cursor.execute(q, ids)
+        db.commit()
+        return {"purged": len(ids)}
+    finally:
+        if "cursor" in locals(): cursor.close()
+        if "db" in locals(): db.close()
+
+##############################
+def decode_audio(path):
+    """Decode a track to mono float32 samples; ffmpeg for any format, the wave module for WAV without it."""
+    if shutil.which("ffmpeg"):
+        command = ["ffmpeg", "-v", "error", "-i", path, "-ac", "1", "-ar", str(x.ANALYSIS_SAMPLE_RATE), "-f", "f32le", "-"]
+        result = subprocess.run(command, capture_output=True, check=True, timeout=300)
+        return np.frombuffer(result.stdout, dtype="<f4"), x.ANALYSIS_SAMPLE_RATE
+    
+    with wave.open(path, "rb") as track:
+        width, channels, rate = track.getsampwidth(), track.getnchannels(), track.getframerate()
+        frames = track.readframes(track.getnframes())
+    samples = np.frombuffer(frames, dtype={1: np.uint8, 2: "<i2", 4: "<i4"}[width]).astype(np.float32)
+    if width == 1: samples -= 128
+    return samples.reshape(-1, channels).mean(axis=1), rate
+
+def compute_peaks(samples, count):
+    """Max absolute amplitude in each of count equal buckets, scaled to 0-100."""
+    if not samples.size: return [0] * count
+    bucket = -(-samples.size // count)
+    padded = np.zeros(bucket * count, dtype=np.float32)
+    padded[:samples.size] = np.abs(samples)
+    peaks = padded.reshape(count, bucket).max(axis=1)
+    top = peaks.max()
+    if top > 0: peaks = peaks / top
+    return np.rint(peaks * 100).astype(int).tolist()
+
+def analyze_audio():
+    """Fill media_duration and media_peaks for audio posts the app marked 'pending'."""
+    try:
+        db, cursor = x.db()
+        q = "SELECT id, media_path FROM posts WHERE media_status = 'pending' ORDER BY id LIMIT %s"
+        cursor.execute(q, (x.ANALYSIS_BATCH_SIZE,))
+        posts = cursor.fetchall()
+        ready = failed = 0
+        
+        for post in posts:
+            # media_path in the WHERE skips posts whose file was replaced while we decoded;
+            # updated_at = updated_at keeps the analysis from looking like an edit
+            try:
+                samples, rate = decode_audio(os.path.join(x.MEDIA_FOLDER, post["media_path"]))
+                q = """
+                    UPDATE posts
+                    SET media_status = 'ready', media_duration = %s, media_peaks = %s, updated_at = updated_at
+                    WHERE id = %s AND media_path = %s
+                """
+                cursor.execute(q, (round(samples.size / rate), json.dumps(compute_peaks(samples, x.ANALYSIS_PEAKS)), post["id"], post["media_path"]))
+                ready += 1
+            except Exception as ex:
+                ic(post["id"], ex)
+                q = "UPDATE posts SET media_status = 'failed', updated_at = updated_at WHERE id = %s AND media_path = %s"
+                cursor.execute(q, (post["id"], post["media_path"]))
+                failed += 1
+            db.commit()
+        return {"ready": ready, "failed": failed} if posts else None
+    finally:
+        if "cursor" in locals(): cursor.close()
+        if "db" in locals(): db.close()
+
+##############################
+def sweep_sessions():
+    """Drop expired server-side sessions for the mariadb or filesystem backend."""
+    if x.SESSION_BACKEND == "filesystem":
+        cutoff = time.time() - x.SESSION_LIFETIME_SECONDS
+        removed = 0
+        for entry in os.scandir(x.SESSION_FILE_DIR) if os.path.isdir(x.SESSION_FILE_DIR) else []:
+            # FileSystemCache keeps its entry count beside the sessions
+            if entry.is_file() and entry.name != "__wz_cache_count" and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        return {"removed": removed} if removed else None
+    if x.SESSION_BACKEND != "mariadb": return None
+    
+    try:
+        db, cursor = x.db()
+        removed = 0
+        while True:
+            q = "DELETE FROM sessions WHERE expires_at < NOW() LIMIT 1000"
+            cursor.execute(q)
+            db.commit()
+            removed += cursor.rowcount
+            if cursor.rowcount < 1000: break
+        return {"removed": removed} if removed else None
+    finally:
+        if "cursor" in locals(): cursor.close()
+        if "db" in locals(): db.close()
+
+##############################
+def flush_counters():
+    """Fold counter_deltas into their target columns: one UPDATE per counter and target, however many deltas."""
+    try:
+        db, cursor = x.db()
+        # One flusher at a time without locking rows: FOR UPDATE would gap-lock the end of the
+        # index and hold every like and play INSERT until the flush commits
+        q = "SELECT GET_LOCK('flush_counters', 0) as locked"
+        cursor.execute(q)
+        if not cursor.fetchone()["locked"]: return None
+        
+        # Delete by the ids we read, never by range, so a delta committed mid-flush is not lost
+        q = "SELECT id, counter, target_id, delta FROM counter_deltas ORDER BY id LIMIT %s"
+        cursor.execute(q, (x.COUNTER_FLUSH_BATCH,))
+        deltas = cursor.fetchall()
+        if not deltas:
+            db.commit()
+            return None
+        
+        totals = {}
+        for row in deltas:
+            key = (row["counter"], row["target_id"])
+            totals[key] = totals.get(key, 0) + row["delta"]
+        for (counter, target_id), delta in totals.items():
+            if not delta or counter not in x.COUNTERS: continue
+            table, column = x.COUNTERS[counter]
+            q = f"UPDATE {table} SET {column} = GREATEST({column} + %s, 0), updated_at = updated_at WHERE id = %s"
+            cursor.execute(q, (delta, target_id))
+        
+        ids = [row["id"] for row in deltas]
+        for start in range(0, len(ids), 1000):
+            chunk = ids[start:start + 1000]
+            q = f"DELETE FROM counter_deltas WHERE id IN ({', '.join(['%s'] * len(chunk))})"
+            cursor.execute(q, chunk)
+        db.commit()
+        return {"deltas": len(deltas), "targets": len(totals)}
+    finally:
+        if "cursor" in locals():
+            # No-op if the lock was never taken; the connection may go back to a pool, so never leave it held
+            cursor.execute("DO RELEASE_LOCK('flush_counters')")
+            cursor.close()
+        if "db" in locals(): db.close()
+
+##############################
+def recount_user_counters():
+    """Repair drift in users.post_count/following_count/followers_count, a range of ids per statement."""
+    try:
+        db, cursor = x.db()
+        q = "SELECT COALESCE(MAX(id), 0) as max_id FROM users"
+        cursor.execute(q)
+        max_id = cursor.fetchone()["max_id"]
+        repaired = 0
+        for start in range(0, max_id, 1000):
+            q = """
+                UPDATE users u
+                LEFT JOIN (SELECT user_id, COUNT(*) as n FROM posts
+                           WHERE user_id > %s AND user_id <= %s AND is_blocked = FALSE GROUP BY user_id) p ON p.user_id = u.id
+                LEFT JOIN (SELECT follower_id, COUNT(*) as n FROM follows
+                           WHERE follower_id > %s AND follower_id <= %s GROUP BY follower_id) fg ON fg.follower_id = u.id
+                LEFT JOIN (SELECT following_id, COUNT(*) as n FROM follows
+                           WHERE following_id > %s AND following_id <= %s GROUP BY following_id) fr ON fr.following_id = u.id
+                SET u.post_count = COALESCE(p.n, 0),
+                    u.following_count = COALESCE(fg.n, 0),
+                    u.followers_count = COALESCE(fr.n, 0),
+                    u.updated_at = u.updated_at
+                WHERE u.id > %s AND u.id <= %s
+                AND (u.post_count <> COALESCE(p.n, 0) OR u.following_count <> COALESCE(fg.n, 0) OR u.followers_count <> COALESCE(fr.n, 0))
+            """
+            cursor.execute(q, (start, start + 1000) * 4)
+            repaired += cursor.rowcount
+            db.commit()
+        return {"repaired": repaired} if repaired else None
+    finally:
+        if "cursor" in locals(): cursor.close()
+        if "db" in locals(): db.close()
+
+##############################
+# name: (job, seconds between runs)
+JOBS = {
+    "tag_stats": (refresh_tag_stats, x.TAG_STATS_REFRESH_SECONDS),
+    "email_outbox": (drain_email_outbox, x.EMAIL_OUTBOX_POLL_SECONDS),
+    "upload_sessions": (purge_upload_sessions, 60 * 60),
+    "audio_analysis": (analyze_audio, x.ANALYSIS_POLL_SECONDS),
+    "counters": (flush_counters, x.COUNTER_FLUSH_SECONDS),
+    "sessions": (sweep_sessions, 15 * 60),
+    "user_counters": (recount_user_counters, 24 * 60 * 60),
+}
+
+def run_once(names):
+    for name in names:
+        try:
+            result = JOBS[name][0]()
+            if result: ic(name, result)
+        except Exception as ex:
+            ic(name, ex)
+
+def run_forever(names):
+    next_run = {name: 0 for name in names}
+    while True:
+        for name in names:
+            if time.monotonic() >= next_run[name]:
+                run_once([name])
+                next_run[name] = time.monotonic() + JOBS[name][1]
+        time.sleep(max(0.1, min(next_run.values()) - time.monotonic()))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    once = "--once" in args
+    names = [arg for arg in args if arg != "--once"] or list(JOBS)
+    unknown = [name for name in names if name not in JOBS]
+    if unknown: sys.exit(f"Unknown job(s): {', '.join(unknown)}. Available: {', '.join(JOBS)}")
+    run_once(names) if once else run_forever(names)
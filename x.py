@@ -1,21 +1,73 @@
-from flask import request, make_response, render_template
+from flask import request, make_response, render_template, g, has_app_context
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from flask_session import Session
+from cachelib.file import FileSystemCache
+from werkzeug.datastructures import CallbackDict
 import mysql.connector
-import re 
+import re
 import dictionary
+import bisect
+import hashlib
+import heapq
+import io
+import os
+import importlib
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+import secrets
 
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from functools import wraps
+from contextlib import contextmanager
+from functools import lru_cache, wraps
 
 import json
 
 
+from PIL import Image, ImageOps
 from icecream import ic
 ic.configureOutput(prefix=f'----- | ', includeContext=True)
 
 UPLOAD_ITEM_FOLDER = './images'
 
+# Uploaded audio; names are unique per upload, so a URL's bytes never change
+MEDIA_FOLDER = os.path.join("static", "uploads")
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+AUDIO_MIMETYPES = {
+    "mp3": "audio/mpeg",
+    "wav": "audio/wav",
+    "ogg": "audio/ogg",
+    "m4a": "audio/mp4",
+    "aac": "audio/aac",
+}
+
+# Avatars are stored only as square variants named by content hash: <hash>-<size>.<ext>
+AVATAR_FOLDER = os.path.join("static", "uploads", "avatars")
+AVATAR_SIZES = (64, 128, 256)
+AVATAR_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+REGEX_AVATAR_VARIANT = r"^[0-9a-f]{16}-(64|128|256)\.(webp|jpg)$"
+
+# Chunked uploads: parts are written here (outside static/) until claimed by a post
+UPLOAD_PARTS_FOLDER = os.environ.get("UPLOAD_PARTS_FOLDER", "upload_parts")
+UPLOAD_MAX_SIZE = int(os.environ.get("UPLOAD_MAX_SIZE", 100 * 1024 * 1024))
+# Must stay under MAX_CONTENT_LENGTH, which still caps each request body
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 4 * 1024 * 1024))
+UPLOAD_SESSION_HOURS = int(os.environ.get("UPLOAD_SESSION_HOURS", 24))
+
+# Audio analysis (worker.py): tracks are decoded to mono at this rate, which is plenty for duration and peaks
+ANALYSIS_SAMPLE_RATE = int(os.environ.get("ANALYSIS_SAMPLE_RATE", 8000))
+ANALYSIS_PEAKS = int(os.environ.get("ANALYSIS_PEAKS", 64))
+ANALYSIS_BATCH_SIZE = int(os.environ.get("ANALYSIS_BATCH_SIZE", 10))
+ANALYSIS_POLL_SECONDS = float(os.environ.get("ANALYSIS_POLL_SECONDS", 5))
+
+def format_duration(seconds):
+    if not seconds: return ""
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
 ##############################
 allowed_languages = ["english", "danish", "spanish"]
 google_spread_sheet_key = "1idGoFNeQMca6Q1mJpr4HPbuXfRdDE9DHmOOnvIt-b3Q"
@@ -28,42 +80,655 @@ language_code_map = {
     "spanish": "sp"
 }
 
+DICTIONARY_JSON_PATH = "dictionary.json"
+# How often (seconds) a request may stat the dictionary files for changes
+CATALOG_CHECK_SECONDS = float(os.environ.get("CATALOG_CHECK_SECONDS", 2))
+
+class TranslationCatalog:
+    """dictionary.py and dictionary.json merged once into a flat {language: {key: text}} table."""
+
+    def __init__(self):
+        self.tables = {language: {} for language in allowed_languages}
+        # Content hash of the tables, the same in every worker; caches of translated output key on it
+        self.version = ""
+        self._mtimes = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def _file_mtimes(self):
+        mtimes = []
+        for path in (dictionary.__file__, DICTIONARY_JSON_PATH):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def load(self):
+        with self._lock:
+            mtimes = self._file_mtimes()
+            if self._mtimes is not None and mtimes[0] != self._mtimes[0]:
+                importlib.reload(dictionary)
+            try:
+                with open(DICTIONARY_JSON_PATH, 'r', encoding='utf-8') as file:
+                    json_data = json.load(file)
+            except (OSError, ValueError) as ex:
+                ic(ex)
+                json_data = {}
+
+            module_data = {key: value for key, value in vars(dictionary).items()
+                           if not key.startswith("_") and isinstance(value, dict)}
+            tables = {}
+            for language in allowed_languages:
+                lang_code = language_code_map.get(language, "en")
+                # dictionary.py wins over dictionary.json, as the per-call lookup always did
+                table = {key: value.get(language, key) for key, value in json_data.items() if isinstance(value, dict)}
+                for key, value in module_data.items():
+                    table[key] = value.get(lang_code, value.get("en", key))
+                tables[language] = table
+            self.tables = tables
+            # After the tables: output rendered in between is cached under the old version, never the new
+            self.version = hashlib.sha256(json.dumps(tables, sort_keys=True, default=str).encode()).hexdigest()[:16]
+            self._mtimes = mtimes
+            self._checked_at = time.monotonic()
+
+    def maybe_reload(self):
+        """Reload if either file changed; stats the files at most every CATALOG_CHECK_SECONDS."""
+        if time.monotonic() - self._checked_at < CATALOG_CHECK_SECONDS: return
+        self._checked_at = time.monotonic()
+        if self._file_mtimes() != self._mtimes: self.load()
+
+    def lookup(self, language):
+        """A lans(key) bound to one language's table, for a single render."""
+        table = self.tables.get(language) or self.tables.get("english", {})
+        return lambda key: table.get(key, key)
+
+catalog = TranslationCatalog()
+catalog.load()
+
 def lans(key):
-    """Get translation for current language from dictionary module."""
-    lang_code = language_code_map.get(default_language, "en")
-    try:
-        dict_obj = getattr(dictionary, key)
-        return dict_obj.get(lang_code, dict_obj.get("en", key))
-    except AttributeError:
-        # Fallback to JSON if key not in dictionary module
-        try:
-            with open("dictionary.json", 'r', encoding='utf-8') as file:
-                data = json.load(file)
-            return data.get(key, {}).get(default_language, key)
-        except:
-            return key
+    """Get translation for current language from the preloaded catalog."""
+    return catalog.lookup(default_language)(key)
 
 ##############################
+DB_HOST = os.environ.get("DB_HOST", "mariadb")
+DB_USER = os.environ.get("DB_USER", "root")
+DB_PASSWORD = os.environ.get("DB_PASSWORD", "password")
+DB_NAME = os.environ.get("DB_NAME", "echoverse_app")
+# One connection per gunicorn thread plus one for the mariadb session backend; more would sit idle
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", int(os.environ.get("WEB_THREADS", 4)) + 1))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))
+# Connections idle for less than this are handed out without a ping
+DB_POOL_PING_INTERVAL = float(os.environ.get("DB_POOL_PING_INTERVAL", 30))
+
+def db_connect():
+    """Open a new, unpooled connection."""
+    return mysql.connector.connect(
+        host = DB_HOST,
+        user = DB_USER,
+        password = DB_PASSWORD,
+        database = DB_NAME
+    )
+
+class DbPool:
+    """Fixed-size connection pool with a health check on checkout."""
+
+    def __init__(self, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._peak_in_use = 0
+
+    def acquire(self):
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            try:
+                conn, released_at = self._idle.get_nowait()
+                break
+            except queue.Empty:
+                pass
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create: self._created += 1
+            if can_create:
+                try:
+                    conn, released_at = db_connect(), time.monotonic()
+                    break
+                except Exception:
+                    with self._lock: self._created -= 1
+                    raise
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                with self._lock: self._timeouts += 1
+                raise Exception("Twitter exception - Database pool exhausted", 503)
+            waited = True
+            try:
+                # Short waits so a slot freed by a discarded connection is noticed
+                conn, released_at = self._idle.get(timeout=min(remaining, 0.05))
+                break
+            except queue.Empty:
+                continue
+
+        if time.monotonic() - released_at > DB_POOL_PING_INTERVAL:
+            try:
+                conn.ping(reconnect=True, attempts=2, delay=0)
+            except Exception:
+                self._discard(conn)
+                with self._lock: self._created += 1
+                try:
+                    conn = db_connect()
+                except Exception:
+                    with self._lock: self._created -= 1
+                    raise
+
+        wait = time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            if waited:
+                self._waits += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+        return conn
+
+    def release(self, conn):
+        with self._lock: self._in_use -= 1
+        try:
+            if conn.in_transaction: conn.rollback()
+        except Exception as ex:
+            ic(ex)
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def _discard(self, conn):
+        with self._lock: self._created -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def prime(self, count=None):
+        """Open connections up front so the first requests don't pay for them."""
+        conns = [self.acquire() for _ in range(min(count or self.size, self.size))]
+        for conn in conns: self.release(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "peak_in_use": self._peak_in_use,
+                "saturation": round(self._in_use / self.size, 3) if self.size else 0,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_avg_ms": round(self._wait_total / self._waits * 1000, 3) if self._waits else 0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def db_pool():
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None: _db_pool = DbPool()
+    return _db_pool
+
 def db():
+    """Return (db, cursor). Inside a request every call shares one pooled connection."""
     try:
-        db = mysql.connector.connect(
-            host = "mariadb",
-            user = "root",  
-            password = "password",
-            database = "echoverse_app"
-        )
-        cursor = db.cursor(dictionary=True)
+        if has_app_context():
+            if "db" not in g: g.db = db_pool().acquire()
+            db = g.db
+        else:
+            db = db_connect()
+        cursor = db.cursor(dictionary=True, buffered=True)
+        if has_app_context(): cursor = InstrumentedCursor(cursor)
         return db, cursor
     except Exception as e:
         print(e, flush=True)
+        if len(e.args) >= 2 and e.args[1] == 503: raise
         raise Exception("Twitter exception - Database under maintenance", 500)
 
+def db_release(db):
+    """Close a connection unless it is the request's pooled one (returned at teardown)."""
+    if has_app_context() and g.get("db") is db: return
+    db.close()
+
+def db_teardown(exception=None):
+    db = g.pop("db", None)
+    if db is not None: db_pool().release(db)
+
 
 ##############################
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+# The same statement this many times in one request is almost always an N+1
+REPEATED_QUERY_WARN = int(os.environ.get("REPEATED_QUERY_WARN", 10))
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "true").lower() == "true"
+# Per-route statement breakdown kept by /admin/query-stats
+QUERY_STATS_TOP = 10
+
+@lru_cache(maxsize=1024)
+def query_fingerprint(q):
+    """Statement shape: whitespace, literals and IN lists collapsed, so the same query groups together."""
+    q = re.sub(r"\s+", " ", q).strip()
+    q = re.sub(r"'(?:[^'\\]|\\.|'')*'", "?", q)
+    q = re.sub(r"\b\d+\b", "?", q)
+    q = q.replace("%s", "?")
+    return re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?+)", q)
+
+class InstrumentedCursor:
+    """Cursor wrapper that times every statement into the current request's g.sql."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def _record(self, q, started):
+        ms = (time.perf_counter() - started) * 1000
+        sql = g.get("sql")
+        if sql is None: return
+        fingerprint = query_fingerprint(q)
+        sql["count"] += 1
+        sql["ms"] += ms
+        count, total_ms, max_ms = sql["statements"].get(fingerprint, (0, 0.0, 0.0))
+        sql["statements"][fingerprint] = (count + 1, total_ms + ms, max(max_ms, ms))
+        if ms >= SLOW_QUERY_MS:
+            sql["slow"] += 1
+            print(f"Slow query {ms:.1f} ms [{request.endpoint}] {fingerprint}", flush=True)
+
+    def execute(self, q, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(q, params, *args, **kwargs)
+        finally:
+            self._record(q, started)
+
+    def executemany(self, q, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(q, seq_params, *args, **kwargs)
+        finally:
+            self._record(q, started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class QueryStats:
+    """Per-route query totals since the process started."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, sql, total_ms, failed):
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                "requests": 0, "errors": 0, "queries": 0, "max_queries": 0, "slow_queries": 0,
+                "db_ms": 0.0, "total_ms": 0.0, "statements": {},
+            })
+            stats["requests"] += 1
+            stats["errors"] += failed
+            stats["queries"] += sql["count"]
+            stats["max_queries"] = max(stats["max_queries"], sql["count"])
+            stats["slow_queries"] += sql["slow"]
+            stats["db_ms"] += sql["ms"]
+            stats["total_ms"] += total_ms
+            for fingerprint, (count, ms, max_ms) in sql["statements"].items():
+                statement = stats["statements"].setdefault(fingerprint, {"count": 0, "ms": 0.0, "max_ms": 0.0, "max_per_request": 0})
+                statement["count"] += count
+                statement["ms"] += ms
+                statement["max_ms"] = max(statement["max_ms"], max_ms)
+                statement["max_per_request"] = max(statement["max_per_request"], count)
+
+    def reset(self):
+        with self._lock: self._routes = {}
+
+    def snapshot(self):
+        """Routes by total DB time, each with averages and its most expensive statements."""
+        with self._lock:
+            routes = []
+            for route, stats in self._routes.items():
+                statements = sorted(stats["statements"].items(), key=lambda item: item[1]["ms"], reverse=True)
+                requests = stats["requests"]
+                routes.append({
+                    "route": route,
+                    "requests": requests,
+                    "errors": stats["errors"],
+                    "avg_queries": round(stats["queries"] / requests, 2),
+                    "max_queries": stats["max_queries"],
+                    "slow_queries": stats["slow_queries"],
+                    "avg_db_ms": round(stats["db_ms"] / requests, 3),
+                    "avg_total_ms": round(stats["total_ms"] / requests, 3),
+                    "db_ms": round(stats["db_ms"], 3),
+                    "statements": [
+                        {
+                            "fingerprint": fingerprint,
+                            "count": statement["count"],
+                            "per_request": round(statement["count"] / requests, 2),
+                            "max_per_request": statement["max_per_request"],
+                            "avg_ms": round(statement["ms"] / statement["count"], 3),
+                            "max_ms": round(statement["max_ms"], 3),
+                        }
+                        for fingerprint, statement in statements[:QUERY_STATS_TOP]
+                    ],
+                })
+            return sorted(routes, key=lambda route: route["db_ms"], reverse=True)
+
+query_stats = QueryStats()
+
+def begin_request_stats():
+    g.request_started = time.perf_counter()
+    g.sql = {"count": 0, "ms": 0.0, "slow": 0, "statements": {}}
+
+def finish_request_stats(response):
+    """Record the request's queries per route, warn on repeated statements and add Server-Timing."""
+    sql = g.get("sql")
+    if sql is None: return response
+    total_ms = (time.perf_counter() - g.request_started) * 1000
+    route = f"{request.method} {request.url_rule.rule if request.url_rule else 'unmatched'}"
+    for fingerprint, (count, ms, max_ms) in sql["statements"].items():
+        if count >= REPEATED_QUERY_WARN:
+            print(f"Repeated query x{count} ({ms:.1f} ms) [{route}] {fingerprint}", flush=True)
+    query_stats.record(route, sql, total_ms, response.status_code >= 500)
+    if SERVER_TIMING:
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={sql["ms"]:.2f};desc="{sql["count"]} queries", app;dur={max(total_ms - sql["ms"], 0):.2f}'
+        )
+    return response
+
+
+##############################
+# cookie: signed cookie, no server storage (fastest) | mariadb: sessions table | filesystem: Flask-Session files
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "cookie")
+SESSION_LIFETIME_SECONDS = int(os.environ.get("SESSION_LIFETIME_SECONDS", 7 * 24 * 60 * 60))
+SESSION_FILE_DIR = os.environ.get("SESSION_FILE_DIR", "flask_session")
+# app.py's fallback secret; publicly known, so it must never sign a cookie that carries the session itself
+DEV_SECRET_KEY = "dev-secret-key-change-me"
+if SESSION_BACKEND == "cookie" and os.environ.get("SECRET_KEY", DEV_SECRET_KEY) in ("", DEV_SECRET_KEY):
+    # Resolved here so the worker sweeps the sessions table the app falls back to
+    print("SECRET_KEY is not set; sessions use the mariadb backend instead of signed cookies", flush=True)
+    SESSION_BACKEND = "mariadb"
+
+class DbSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, touch=False):
+        def on_update(session):
+            session.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.touch = touch
+        self.modified = False
+
+class DbSessionInterface(SessionInterface):
+    """Sessions stored as JSON rows in the sessions table, keyed by a random id in the cookie.
+
+    Unchanged sessions are not written back; expires_at slides forward at most once per half lifetime.
+    """
+    serializer = TaggedJSONSerializer()
+
+    def _execute(self, q, params, fetch=False):
+        # A connection of its own, so saving the session never commits a route's unfinished work
+        conn = db_pool().acquire()
+        try:
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            cursor.execute(q, params)
+            row = cursor.fetchone() if fetch else None
+            conn.commit()
+            cursor.close()
+            return row
+        finally:
+            db_pool().release(conn)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app), "")
+        if not re.match(r"^[A-Za-z0-9_-]{43}$", sid):
+            return DbSession(sid=secrets.token_urlsafe(32), new=True)
+        q = "SELECT data, expires_at FROM sessions WHERE id = %s AND expires_at > NOW()"
+        row = self._execute(q, (sid,), fetch=True)
+        if not row:
+            return DbSession(sid=secrets.token_urlsafe(32), new=True)
+        remaining = (row["expires_at"] - datetime.now()).total_seconds()
+        return DbSession(self.serializer.loads(row["data"]), sid=sid, touch=remaining < SESSION_LIFETIME_SECONDS / 2)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                self._execute("DELETE FROM sessions WHERE id = %s", (session.sid,))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not session.modified and not session.touch: return
+
+        if session.modified:
+            q = """
+                INSERT INTO sessions (id, data, expires_at)
+                VALUES (%s, %s, DATE_ADD(NOW(), INTERVAL %s SECOND))
+                ON DUPLICATE KEY UPDATE data = VALUES(data), expires_at = VALUES(expires_at)
+            """
+            self._execute(q, (session.sid, self.serializer.dumps(dict(session)), SESSION_LIFETIME_SECONDS))
+        else:
+            q = "UPDATE sessions SET expires_at = DATE_ADD(NOW(), INTERVAL %s SECOND) WHERE id = %s"
+            self._execute(q, (SESSION_LIFETIME_SECONDS, session.sid))
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+def configure_sessions(app, backend=None):
+    backend = backend or SESSION_BACKEND
+    if backend == "cookie" and app.secret_key in (None, "", DEV_SECRET_KEY):
+        # Anyone knowing the key could sign {"user": ...} and log in as anyone; keep only a random id client-side
+        backend = "mariadb"
+    app.permanent_session_lifetime = timedelta(seconds=SESSION_LIFETIME_SECONDS)
+    if backend == "filesystem":
+        # Flask-Session's own 'filesystem' type ignores SESSION_CACHELIB and always writes to ./flask_session
+        app.config['SESSION_TYPE'] = 'cachelib'
+        app.config['SESSION_CACHELIB'] = FileSystemCache(SESSION_FILE_DIR, threshold=500, default_timeout=SESSION_LIFETIME_SECONDS)
+        Session(app)
+    elif backend == "mariadb":
+        app.session_interface = DbSessionInterface()
+    elif backend != "cookie":
+        raise ValueError(f"Unknown SESSION_BACKEND {backend!r}; use cookie, mariadb or filesystem")
+
+
+##############################
+class TTLCache:
+    """Small thread-safe in-process cache; entries expire after ttl seconds."""
+
+    def __init__(self, ttl, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None: return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            # Re-insert so dict order stays expiry order (every caller uses the cache's own ttl)
+            self._data.pop(key, None)
+            if len(self._data) >= self.max_size:
+                # Drop the entry closest to expiry rather than growing without bound
+                del self._data[next(iter(self._data))]
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# Per-user (blocked, blocked_by) id sets; the blocking worker invalidates at once, others within the TTL
+BLOCK_CACHE_TTL = float(os.environ.get("BLOCK_CACHE_TTL", 60))
+block_cache = TTLCache(BLOCK_CACHE_TTL)
+
+# Trending and popular tags, refreshed into tag_stats by worker.py and cached here
+TAG_STATS_REFRESH_SECONDS = float(os.environ.get("TAG_STATS_REFRESH_SECONDS", 300))
+TAG_STATS_TTL = float(os.environ.get("TAG_STATS_TTL", 60))
+TAG_STATS_TOP_K = int(os.environ.get("TAG_STATS_TOP_K", 100))
+tag_stats_cache = TTLCache(TAG_STATS_TTL)
+
+# Tag autocomplete: every tag name in a sorted array, searched by prefix with bisect
+TAG_INDEX_REFRESH_SECONDS = float(os.environ.get("TAG_INDEX_REFRESH_SECONDS", TAG_STATS_REFRESH_SECONDS))
+TAG_SUGGEST_LIMIT = int(os.environ.get("TAG_SUGGEST_LIMIT", 8))
+# Prefixes this short match too many tags to rank per request, so their answers are memoized
+TAG_MEMO_PREFIX_LENGTH = 2
+
+class TagIndex:
+    """Tag names ranked by post count for prefix lookups.
+
+    Reads never lock: add() builds a new (names, counts) snapshot and swaps it in. Tags created by
+    other workers show up at the next reload, every TAG_INDEX_REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self._snapshot = ([], {})
+        self._memo = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    def is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > TAG_INDEX_REFRESH_SECONDS
+
+    @contextmanager
+    def reloading(self):
+        """Yields whether this thread should load(): one thread reloads, the rest keep serving the old snapshot.
+
+        Before the first load there is nothing to serve, so other threads wait for it instead.
+        """
+        if not self._reload_lock.acquire(blocking=self._loaded_at is None):
+            yield False
+            return
+        try:
+            yield self.is_stale()
+        finally:
+            self._reload_lock.release()
+
+    def load(self, cursor):
+        q = """
+            SELECT t.name, COALESCE(ts.post_count, 0) as post_count
+            FROM tags t
+            LEFT JOIN tag_stats ts ON ts.tag_id = t.id
+        """
+        cursor.execute(q)
+        counts = {row["name"]: row["post_count"] for row in cursor.fetchall()}
+        with self._lock:
+            self._snapshot = (sorted(counts), counts)
+            self._memo = {}
+            self._loaded_at = time.monotonic()
+
+    def add(self, names):
+        """Count one more post for each name, adding names the index has not seen."""
+        with self._lock:
+            names_sorted, counts = self._snapshot
+            counts = dict(counts)
+            new_names = set()
+            for name in names:
+                if name not in counts: new_names.add(name)
+                counts[name] = counts.get(name, 0) + 1
+            if new_names: names_sorted = sorted([*names_sorted, *new_names])
+            self._snapshot = (names_sorted, counts)
+            self._memo = {}
+
+    def suggest(self, prefix, limit=TAG_SUGGEST_LIMIT):
+        """Up to limit tag names starting with prefix, most used first."""
+        memo_key = (prefix, limit) if len(prefix) <= TAG_MEMO_PREFIX_LENGTH else None
+        memo = self._memo
+        if memo_key in memo: return memo[memo_key]
+        names, counts = self._snapshot
+        start = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_left(names, prefix + "\U0010ffff", start)
+        tags = heapq.nsmallest(limit, names[start:end], key=lambda name: (-counts[name], name))
+        if memo_key: memo[memo_key] = tags
+        return tags
+
+tag_index = TagIndex()
+
+# Rendered post cards by (post id, language, catalog version), each stored with the post version it was rendered from
+POST_CARD_CACHE_TTL = float(os.environ.get("POST_CARD_CACHE_TTL", 600))
+POST_CARD_CACHE_SIZE = int(os.environ.get("POST_CARD_CACHE_SIZE", 5000))
+post_card_cache = TTLCache(POST_CARD_CACHE_TTL, POST_CARD_CACHE_SIZE)
+
+
+##############################
+def asset_version():
+    """Fingerprint of templates and static assets (uploads excluded), so a deploy never gets a 304 for old markup."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for folder in ("templates", "static"):
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root, folder)):
+            dirnames[:] = sorted(name for name in dirnames if name != "uploads")
+            for filename in sorted(filenames):
+                stat = os.stat(os.path.join(dirpath, filename))
+                digest.update(f"{dirpath}/{filename}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+ASSET_VERSION = asset_version()
+
+def make_etag(*parts):
+    """Validator for a private response built from parts (anything with a stable repr).
+
+    Folds in the asset and translation catalog versions, so neither a deploy nor a translations
+    reload is answered with a 304 for the old markup or text.
+    """
+    return hashlib.sha256(repr((ASSET_VERSION, catalog.version, parts)).encode()).hexdigest()[:32]
+
+def revalidate(response, etag):
+    """Private and revalidated on every use: the browser may keep its copy, shared caches may not."""
+    response = make_response(response)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+def not_modified(etag):
+    """A bare 304 when the client already has etag, otherwise None."""
+    if etag not in request.if_none_match: return None
+    return revalidate(make_response("", 304), etag)
+
 def no_cache(view):
+    """no-store, unless the view attached its own validator with revalidate()."""
     @wraps(view)
     def no_cache_view(*args, **kwargs):
         response = make_response(view(*args, **kwargs))
+        if response.headers.get("ETag"): return response
         response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
         response.headers["Pragma"] = "no-cache"
         response.headers["Expires"] = "0"
@@ -167,40 +832,236 @@ def validate_post(post = ""):
 
 
 ##############################
-def send_email(to_email, subject, template):
+FEED_PAGE_SIZE = int(os.environ.get("FEED_PAGE_SIZE", 20))
+FEED_CURSOR_FORMAT = "%Y%m%d%H%M%S%f"
+
+def encode_feed_cursor(post):
+    """Opaque keyset cursor pointing just past post (created_at, id)."""
+    return f"{post['created_at'].strftime(FEED_CURSOR_FORMAT)}-{post['id']}"
+
+def decode_feed_cursor(cursor = ""):
+    if not cursor: return None
+    error = "Twitter exception - Invalid cursor"
+    try:
+        created_at, post_id = cursor.strip().split("-", 1)
+        return datetime.strptime(created_at, FEED_CURSOR_FORMAT), int(post_id)
+    except ValueError:
+        raise Exception(error, 400)
+
+
+##############################
+def make_avatar_variants(data):
+    """Write every size/format variant of an uploaded image and return the users.avatar path.
+
+    The stored path is the largest JPEG, so anything still building plain static URLs keeps working.
+    """
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    stored_path = f"uploads/avatars/{digest}-{AVATAR_SIZES[-1]}.jpg"
+    if os.path.exists(os.path.join("static", stored_path)): return stored_path
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        # Let JPEG decode at a reduced scale instead of full resolution
+        image.draft("RGB", (AVATAR_SIZES[-1] * 2, AVATAR_SIZES[-1] * 2))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise Exception("Twitter exception - Invalid image", 400)
+
+    os.makedirs(AVATAR_FOLDER, exist_ok=True)
+    # The stored path is written last, so the existence check above only passes once every variant exists
+    for size in AVATAR_SIZES:
+        variant = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        for ext, image_format in AVATAR_FORMATS.items():
+            variant.save(os.path.join(AVATAR_FOLDER, f"{digest}-{size}.{ext}"), image_format, quality=85)
+    return stored_path
+
+def avatar_variant(avatar, size, ext="jpg"):
+    """Variant filename of a stored avatar, or None for external/pre-variant avatars and unknown sizes."""
+    if not avatar or size not in AVATAR_SIZES: return None
+    match = re.match(r"^uploads/avatars/([0-9a-f]{16})-256\.jpg$", avatar)
+    return f"{match.group(1)}-{size}.{ext}" if match else None
+
+def upload_part_path(upload_id):
+    return os.path.join(UPLOAD_PARTS_FOLDER, f"{upload_id}.part")
+
+def validate_upload_size(size = ""):
+    error = f"Twitter exception - Upload size must be 1 to {UPLOAD_MAX_SIZE} bytes"
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise Exception(error, 400)
+    if size < 1 or size > UPLOAD_MAX_SIZE: raise Exception(error, 400)
+    return size
+
+def validate_audio_header(head, file_ext):
+    """Check the first bytes of an upload against the container its extension claims."""
+    error = "Twitter exception - File content does not match an audio format"
+    if file_ext == "mp3": valid = head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0)
+    elif file_ext == "wav": valid = head[:4] == b"RIFF" and head[8:12] == b"WAVE"
+    elif file_ext == "ogg": valid = head[:4] == b"OggS"
+    elif file_ext == "m4a": valid = head[4:8] == b"ftyp"
+    elif file_ext == "aac": valid = head[:4] == b"ADIF" or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xF6 == 0xF0)
+    else: valid = False
+    if not valid: raise Exception(error, 400)
+
+
+##############################
+# Write-behind counters: increments are appended to counter_deltas and folded into the
+# target column by worker.py, so hot rows are not locked by every like or play
+COUNTERS = {
+    "post_likes": ("posts", "total_likes"),
+    "post_plays": ("posts", "total_plays"),
+    "song_plays": ("songs", "total_plays"),
+}
+COUNTER_FLUSH_SECONDS = float(os.environ.get("COUNTER_FLUSH_SECONDS", 5))
+COUNTER_FLUSH_BATCH = int(os.environ.get("COUNTER_FLUSH_BATCH", 10000))
+
+def pending_counter_sql(counter, id_col):
+    """SQL for the not-yet-flushed part of a counter; add it to the stored column when reading."""
+    if counter not in COUNTERS: raise ValueError(f"Unknown counter {counter!r}")
+    return f"(SELECT COALESCE(SUM(delta), 0) FROM counter_deltas WHERE counter = '{counter}' AND target_id = {id_col})"
+
+def add_to_counter(cursor, counter, target_id, delta=1):
+    if counter not in COUNTERS: raise ValueError(f"Unknown counter {counter!r}")
+    q = "INSERT INTO counter_deltas (counter, target_id, delta) VALUES (%s, %s, %s)"
+    cursor.execute(q, (counter, target_id, delta))
+
+
+##############################
+# Authors with more followers than this are not fanned out; followers pull their posts at read time
+TIMELINE_FANOUT_LIMIT = int(os.environ.get("TIMELINE_FANOUT_LIMIT", 1000))
+# Posts copied into a timeline when a follow starts or an author is unblocked
+TIMELINE_BACKFILL_LIMIT = int(os.environ.get("TIMELINE_BACKFILL_LIMIT", 50))
+
+
+##############################
+# Comments shown per post in feeds; the rest are counted but not loaded
+COMMENT_PREVIEW_LIMIT = int(os.environ.get("COMMENT_PREVIEW_LIMIT", 5))
+
+
+##############################
+SEARCH_LIMITS = {"users": 10, "posts": 20, "songs": 20, "tags": 10}
+# InnoDB FULLTEXT defaults: innodb_ft_min_token_size and the built-in stopword list
+SEARCH_MIN_TERM_LEN = 3
+SEARCH_STOPWORDS = {
+    "about", "are", "com", "for", "from", "how", "that", "the", "this", "was",
+    "what", "when", "where", "who", "will", "with", "und", "www"
+}
+
+def fulltext_query(query = ""):
+    """Boolean-mode MATCH string requiring every term as a prefix; None if no term is indexable."""
+    terms = [term for term in re.findall(r"\w+", query.lower())
+             if len(term) >= SEARCH_MIN_TERM_LEN and term not in SEARCH_STOPWORDS]
+    if not terms: return None
+    return " ".join(f"+{term}*" for term in terms)
+
+def validate_search_page(page = ""):
     try:
-        # Create a gmail fullflaskdemomail
-        # Enable (turn on) 2 step verification/factor in the google account manager
-        # Visit: https://myaccount.google.com/apppasswords
-        # Copy the key : pdru ctfd jdhk xxci
-
-        # Email and password of the sender's Gmail account
-        sender_email = "ek.twitteremail@gmail.com"
-        password = "hpcr jkvb xboo rnvu"  # If 2FA is on, use an App Password instead
-
-        # Receiver email address
-        receiver_email = to_email
-        
-        # Create the email message
-        message = MIMEMultipart()
-        message["From"] = "Echo verse"
-        message["To"] = to_email
-        message["Subject"] = subject
-
-        # Body of the email
-        message.attach(MIMEText(template, "html"))
-
-        # Connect to Gmail's SMTP server and send the email
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()  # Upgrade the connection to secure
-            server.login(sender_email, password)
-            server.sendmail(sender_email, receiver_email, message.as_string())
-        ic("Email sent successfully!")
-
-        return "email sent"
+        page = int(page or 1)
+    except ValueError:
+        raise Exception("Twitter exception - Invalid page", 400)
+    if page < 1: raise Exception("Twitter exception - Invalid page", 400)
+    return page
+
+
+##############################
+# Create a gmail fullflaskdemomail
+# Enable (turn on) 2 step verification/factor in the google account manager
+# Visit: https://myaccount.google.com/apppasswords
+# Copy the key : pdru ctfd jdhk xxci
+SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") == "1"
+# Email and password of the sender's Gmail account (leave SMTP_USER empty to skip login, e.g. for a local aiosmtpd)
+SMTP_USER = os.environ.get("SMTP_USER", "ek.twitteremail@gmail.com")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "hpcr jkvb xboo rnvu")  # If 2FA is on, use an App Password instead
+SMTP_SENDER = os.environ.get("SMTP_SENDER", SMTP_USER or "noreply@echoverse.local")
+# Close the session after this long without sends; servers drop idle connections anyway
+SMTP_IDLE_SECONDS = float(os.environ.get("SMTP_IDLE_SECONDS", 60))
+
+EMAIL_BATCH_SIZE = int(os.environ.get("EMAIL_BATCH_SIZE", 50))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get("EMAIL_MAX_ATTEMPTS", 6))
+EMAIL_RETRY_BASE_SECONDS = int(os.environ.get("EMAIL_RETRY_BASE_SECONDS", 30))
+EMAIL_OUTBOX_POLL_SECONDS = float(os.environ.get("EMAIL_OUTBOX_POLL_SECONDS", 2))
+
+def send_email(cursor, to_email, subject, template):
+    """Queue an email in the outbox; worker.py delivers it once the caller commits."""
+    try:
+        q = """
+            INSERT INTO email_outbox (to_email, subject, body)
+            VALUES (%s, %s, %s)
+        """
+        cursor.execute(q, (to_email, subject, template))
+        ic("Email queued")
+
+        return "email queued"
        
     except Exception as ex:
         ic(ex)
         raise Exception("cannot send email", 500)
-    finally:
-        pass
\ No newline at end of file
+
+def email_outbox_stats(cursor):
+    """Queue depth per status and the age of the oldest due email."""
+    q = """
+        SELECT status, COUNT(*) as total,
+               TIMESTAMPDIFF(SECOND, MIN(CASE WHEN status = 'pending' THEN next_attempt_at END), NOW()) as oldest_due_seconds
+        FROM email_outbox
+        WHERE status != 'sent' OR sent_at >= DATE_SUB(NOW(), INTERVAL 1 HOUR)
+        GROUP BY status
+    """
+    cursor.execute(q)
+    rows = cursor.fetchall()
+    stats = {"pending": 0, "sending": 0, "failed": 0, "sent_last_hour": 0, "oldest_due_seconds": 0}
+    for row in rows:
+        stats["sent_last_hour" if row["status"] == "sent" else row["status"]] = row["total"]
+        if row["status"] == "pending": stats["oldest_due_seconds"] = max(row["oldest_due_seconds"] or 0, 0)
+    return stats
+
+def build_email(to_email, subject, template):
+    message = MIMEMultipart()
+    message["From"] = "Echo verse"
+    message["To"] = to_email
+    message["Subject"] = subject
+
+    # Body of the email
+    message.attach(MIMEText(template, "html"))
+    return message
+
+class SmtpSession:
+    """Long-lived SMTP connection: connect, STARTTLS and log in once, reconnect when dropped."""
+
+    def __init__(self):
+        self.server = None
+        self.last_used = 0
+
+    def _connect(self):
+        self.close()
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+        if SMTP_STARTTLS: server.starttls()  # Upgrade the connection to secure
+        if SMTP_USER: server.login(SMTP_USER, SMTP_PASSWORD)
+        self.server = server
+
+    def send(self, to_email, message):
+        if self.server is None or time.monotonic() - self.last_used > SMTP_IDLE_SECONDS:
+            self._connect()
+        try:
+            self.server.sendmail(SMTP_SENDER, to_email, message.as_string())
+        except smtplib.SMTPServerDisconnected:
+            self._connect()
+            self.server.sendmail(SMTP_SENDER, to_email, message.as_string())
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.server is None: return
+        try:
+            self.server.quit()
+        except Exception:
+            pass
+        self.server = None